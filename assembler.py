@@ -0,0 +1,247 @@
+import io
+import os
+import sys
+import mmap
+import pickle
+import hashlib
+import argparse
+import emulator
+
+#the front-end that turns a program file into the instruction memory of a machine. three formats, chosen by extension:
+#   .a (or anything else)   the original format: one instruction per line, an empty line stops the execution there
+#   .s                      assembly with "# comments" and "label:" definitions; labels can be used as the offset of
+#                           branches and jal, blank and comment-only lines take no address
+#   .bin                    a raw image of little endian RV32I machine words, memory mapped and disassembled into the
+#                           same tokens; the word 0 (an illegal instruction) stands for an empty line
+#every format ends up as the tokens of instmem, which machine decodes. with a cache directory, instmem and the
+#decoded records are pickled under the sha1 of the file, so running the same program again skips all of that
+
+version = 1         #of the cache entries, changing the format of decoded records must change it
+
+rtypes = {"add": (0, 0), "sub": (0, 0x20), "sll": (1, 0), "slt": (2, 0), "sltu": (3, 0),
+          "xor": (4, 0), "srl": (5, 0), "sra": (5, 0x20), "or": (6, 0), "and": (7, 0)}     #op -> (funct3, funct7)
+itypes = {"addi": 0, "slti": 2, "sltui": 3, "xori": 4, "ori": 6, "andi": 7}                 #sltui is the emulator's name of sltiu
+shifts = {"slli": (1, 0), "srli": (5, 0), "srai": (5, 0x20)}
+loads = {"lb": 0, "lh": 1, "lw": 2, "lbu": 4, "lhu": 5}
+stores = {"sb": 0, "sh": 1, "sw": 2}
+branches = {"beq": 0, "bne": 1, "blt": 4, "bge": 5, "bltu": 6, "bgeu": 7}
+system = {"ecall": 0x00000073, "ebreak": 0x00100073}
+
+def tokenize(line):     #the tokenizer machine has always used. example output: ["add","x5","x0","x1"]. tokens are interned,
+    #so a long program holds every distinct token once and its cache entry stores it once
+    return [sys.intern(token) for token in str(line).replace(",", " ").replace("(", " ").replace(")", " ").rsplit()]
+
+def lines(data):        #the lines of a file as reading it in text mode gives them
+    return io.StringIO(data.decode(), newline=None)
+
+def readtext(data):
+    return [tokenize(line) for line in lines(data)]
+
+def assemble(data):     #the tokens of every instruction of an assembly source, with labels replaced by offsets
+    texts = []
+    labels = dict()
+    uses = []           #(index of the instruction, index of the token, label, line number)
+    for number, line in enumerate(lines(data), 1):
+        line = line.split("#", 1)[0]
+        while ":" in line:
+            label, line = line.split(":", 1)
+            label = label.strip()
+            if not label.isidentifier():
+                raise Exception("line %d: invalid label %r" % (number, label))
+            if label in labels:
+                raise Exception("line %d: label %s defined twice" % (number, label))
+            labels[label] = 4 * len(texts)
+        text = tokenize(line)
+        if not text:
+            continue
+        slot = 3 if text[0] in branches else 2 if text[0] == "jal" else None
+        if slot is not None and len(text) > slot and text[slot].isidentifier():
+            uses.append((len(texts), slot, text[slot], number))
+        texts.append(text)
+    for index, slot, label, number in uses:
+        if label not in labels:
+            raise Exception("line %d: undefined label %s" % (number, label))
+        texts[index][slot] = str(labels[label] - 4 * index)
+    return texts
+
+def field(value, bits, name, signed=True, even=False):  #checks that value fits, returns it as an unsigned field
+    low, high = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1) if signed else (0, (1 << bits) - 1)
+    if not low <= value <= high or (even and value & 1):
+        raise Exception("%s %d does not fit" % (name, value))
+    return value & ((1 << bits) - 1)
+
+def encode(text):       #the 32-bit machine word of the tokens of one instruction, 0 for an empty line
+    if not text:
+        return 0
+    op = text[0]
+    reg = lambda i: emulator.machine.regIdx(None, text[i])
+    if op in rtypes:
+        funct3, funct7 = rtypes[op]
+        return (funct7 << 25) | (reg(3) << 20) | (reg(2) << 15) | (funct3 << 12) | (reg(1) << 7) | 0x33
+    if op in itypes:
+        return (field(int(text[3]), 12, "immediate") << 20) | (reg(2) << 15) | (itypes[op] << 12) | (reg(1) << 7) | 0x13
+    if op in shifts:
+        funct3, funct7 = shifts[op]
+        return (funct7 << 25) | (field(int(text[3]), 5, "shift amount", False) << 20) | (reg(2) << 15) | (funct3 << 12) | (reg(1) << 7) | 0x13
+    if op in loads:
+        return (field(int(text[2]), 12, "offset") << 20) | (reg(3) << 15) | (loads[op] << 12) | (reg(1) << 7) | 0x03
+    if op in stores:    #the emulator reads the data register first and the base last, as in "sw x1, 8(sp)"
+        imm = field(int(text[2]), 12, "offset")
+        return ((imm >> 5) << 25) | (reg(1) << 20) | (reg(3) << 15) | (stores[op] << 12) | ((imm & 31) << 7) | 0x23
+    if op in branches:
+        imm = field(int(text[3]), 13, "branch offset", even=True)
+        return (((imm >> 12) & 1) << 31) | (((imm >> 5) & 63) << 25) | (reg(2) << 20) | (reg(1) << 15) | \
+            (branches[op] << 12) | (((imm >> 1) & 15) << 8) | (((imm >> 11) & 1) << 7) | 0x63
+    if op == "jal":
+        imm = field(int(text[2]), 21, "jump offset", even=True)
+        return (((imm >> 20) & 1) << 31) | (((imm >> 1) & 1023) << 21) | (((imm >> 11) & 1) << 20) | \
+            (((imm >> 12) & 255) << 12) | (reg(1) << 7) | 0x6f
+    if op == "jalr":
+        return (field(int(text[2]), 12, "offset") << 20) | (reg(3) << 15) | (reg(1) << 7) | 0x67
+    if op == "lui" or op == "auipc":    #the emulator does not wrap imm << 12 to 32 bits, so a negative immediate and the
+        #unsigned one with the same 20 bits run differently. only the unsigned one is encoded, as it is disassembled
+        return (field(int(text[2]), 20, "upper immediate", signed=False) << 12) | (reg(1) << 7) | (0x37 if op == "lui" else 0x17)
+    if op in system:
+        return system[op]
+    raise Exception("Invalid instruction name")
+
+names = dict()          #(opcode, funct3, funct7 or None) -> op, to disassemble
+for op, (funct3, funct7) in rtypes.items():
+    names[(0x33, funct3, funct7)] = op
+for op, funct3 in itypes.items():
+    names[(0x13, funct3, None)] = op
+for op, (funct3, funct7) in shifts.items():
+    names[(0x13, funct3, funct7)] = op
+for op, funct3 in loads.items():
+    names[(0x03, funct3, None)] = op
+for op, funct3 in stores.items():
+    names[(0x23, funct3, None)] = op
+for op, funct3 in branches.items():
+    names[(0x63, funct3, None)] = op
+
+def signed(value, bits):
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+def disassemble(word):  #the tokens of a machine word, in the form the text formats give them
+    if word == 0:
+        return []
+    opcode, rd, funct3, rs1, rs2, funct7 = word & 127, (word >> 7) & 31, (word >> 12) & 7, (word >> 15) & 31, (word >> 20) & 31, word >> 25
+    x = lambda r: "x%d" % (r)
+    if opcode == 0x33 or (opcode == 0x13 and funct3 in (1, 5)):
+        op = names.get((opcode, funct3, funct7))
+        if op is not None:
+            return [op, x(rd), x(rs1), x(rs2) if opcode == 0x33 else str(rs2)]
+    elif opcode in (0x13, 0x03) and (opcode, funct3, None) in names:
+        op, imm = names[(opcode, funct3, None)], str(signed(word >> 20, 12))
+        return [op, x(rd), x(rs1), imm] if opcode == 0x13 else [op, x(rd), imm, x(rs1)]
+    elif opcode == 0x23 and (opcode, funct3, None) in names:
+        return [names[(opcode, funct3, None)], x(rs2), str(signed((funct7 << 5) | rd, 12)), x(rs1)]
+    elif opcode == 0x63 and (opcode, funct3, None) in names:
+        imm = ((word >> 31) << 12) | (((word >> 7) & 1) << 11) | (((word >> 25) & 63) << 5) | (((word >> 8) & 15) << 1)
+        return [names[(opcode, funct3, None)], x(rs1), x(rs2), str(signed(imm, 13))]
+    elif opcode == 0x6f:
+        imm = ((word >> 31) << 20) | (((word >> 12) & 255) << 12) | (((word >> 20) & 1) << 11) | (((word >> 21) & 1023) << 1)
+        return ["jal", x(rd), str(signed(imm, 21))]
+    elif opcode == 0x67 and funct3 == 0:
+        return ["jalr", x(rd), str(signed(word >> 20, 12)), x(rs1)]
+    elif opcode == 0x37 or opcode == 0x17:
+        return ["lui" if opcode == 0x37 else "auipc", x(rd), str(word >> 12)]
+    for op, code in system.items():
+        if word == code:
+            return [op]
+    return ["invalid", "0x%08x" % (word)]     #decoded as an invalid instruction, so it only fails if executed
+
+def mapimage(path, use):     #use called with a memory map of a binary image, b"" for an empty one
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size % 4:
+            raise Exception("Binary image is not a whole number of words!")
+        if size == 0:
+            return use(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return use(data)
+
+def hashimage(path):    #the sha1 of a binary image, the cache key, without disassembling it
+    return mapimage(path, lambda data: hashlib.sha1(data).digest())
+
+def imagewords(data):
+    view = memoryview(data)
+    if sys.byteorder == "little":
+        words = view.cast("I").tolist()
+    else:
+        words = [int.from_bytes(view[i:i + 4], "little") for i in range(0, len(view), 4)]
+    view.release()
+    return words
+
+def readimage(path):    #the tokens of every instruction of a binary image, read through a memory map
+    words = mapimage(path, imagewords)
+    known = dict()          #a word repeated in the image is disassembled once
+    texts = []
+    for word in words:
+        text = known.get(word)
+        if text is None:
+            text = known[word] = [sys.intern(token) for token in disassemble(word)]
+        texts.append(list(text))
+    return texts
+
+def writeimage(texts, path):    #encodes the tokens of every instruction into a binary image
+    words = []
+    for index, text in enumerate(texts):
+        try:
+            words.append(encode(text))
+        except Exception as e:
+            raise Exception("instruction %d (%s): %s" % (index, " ".join(text), str(e)))
+    with open(path, "wb") as f:
+        f.write(b"".join(word.to_bytes(4, "little") for word in words))
+
+def parse(path, data):
+    if path.endswith(".s"):
+        return assemble(data)
+    return readtext(data)
+
+def load(path, decode, tag="", cache=None):     #(instmem, decoded) of a program file. decode makes the record of one line,
+    #and tag names whatever else the records depend on (the alu), as it is part of the cache key
+    data = None             #an image is only read when it is not in the cache, and then through a memory map
+    if not path.endswith(".bin"):
+        with open(path, "rb") as f:
+            data = f.read()
+    entry = None
+    if cache is not None:
+        digest = hashimage(path) if data is None else hashlib.sha1(data).digest()
+        key = hashlib.sha1(digest + ("%d %s %s" % (version, tag, os.path.splitext(path)[1])).encode()).hexdigest()
+        entry = os.path.join(cache, key + ".pickle")
+        try:
+            with open(entry, "rb") as f:
+                return pickle.load(f)
+        except Exception:   #missing or unreadable, it is made again
+            pass
+    texts = readimage(path) if data is None else parse(path, data)
+    instmem = dict(zip(range(0, 4 * len(texts), 4), texts))
+    records = dict()        #the same line decodes to the same record, so repeated lines share one
+    decoded = []
+    for text in texts:
+        key = tuple(text)
+        rec = records.get(key)
+        if rec is None and key not in records:
+            rec = records[key] = decode(text)
+        decoded.append(rec)
+    if entry is not None:
+        os.makedirs(cache, exist_ok=True)
+        temp = "%s.%d.tmp" % (entry, os.getpid())
+        with open(temp, "wb") as f:
+            pickle.dump((instmem, decoded), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, entry)
+    return instmem, decoded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="assemble a program into a binary image of RV32I machine words")
+    parser.add_argument("inputFileName", help=".s assembly, or a program in the original format")
+    parser.add_argument("-o", "--output", metavar="FILE", help="the image to write, the input with .bin by default")
+    parser.add_argument("--listing", action="store_true", help="print every address, word and instruction")
+    args = parser.parse_args()
+    with open(args.inputFileName, "rb") as f:
+        texts = parse(args.inputFileName, f.read())
+    writeimage(texts, args.output or os.path.splitext(args.inputFileName)[0] + ".bin")
+    if args.listing:
+        for index, text in enumerate(texts):
+            print("%8d  %08x  %s" % (4 * index, encode(text), " ".join(text)))
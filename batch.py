@@ -0,0 +1,124 @@
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import emulator
+import hazard
+import mem
+import ops
+import fastops
+
+#runs many programs in one go, spread over all cores, and prints a table with one line of totals per program.
+#every program is emulated with the streaming timer as its sink (see main --stream), so no dump is kept, and
+#a failing program only gets an error in its line like the BUG message of main, the others are not affected.
+#a worker process that dies breaks the whole pool, so the runs it did not finish are run again one at a time to
+#find the one that killed it, which is the only one failed. --limit stops programs that never end.
+#giving several values to --memory, --alu or --engine sweeps over all their combinations for every program
+
+fields = ("program", "config", "instructions", "cycles", "stalls", "cpi", "seconds", "error")
+
+extensions = (".a", ".s", ".bin")   #the program formats of the assembler module
+
+def findprograms(patterns):     #directories give their programs, anything else is taken as a glob. sorted for a deterministic order
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for extension in extensions:
+                found += glob.glob(os.path.join(pattern, "*" + extension))
+        else:
+            found += glob.glob(pattern) or [pattern]    #a missing file is kept so its error shows in the table
+    return sorted(set(found))
+
+def runprogram(filename, memory="dict", alu="fast", engine="run", limit=None):  #emulates and times one program, in a worker process
+    config = "%s/%s/%s" % (memory, alu, engine)
+    start = time.perf_counter()
+    timing = hazard.timer()
+    error = ""
+    try:
+        mac = emulator.machine(filename, sink=timing.push, memory=mem.memories[memory], alu=fastops if alu == "fast" else ops)
+        getattr(mac, engine)(limit)
+    except Exception as e:      #the timing up to the bug is still reported, as main does
+        error = str(e) or type(e).__name__
+    timing.finish()
+    return result(filename, config, timing.count, timing.clock, timing.stalls, time.perf_counter() - start, error)
+
+def result(filename, config, count, cycles, stalls, seconds, error):
+    return {"program": filename, "config": config, "instructions": count, "cycles": cycles, "stalls": stalls,
+            "cpi": cycles / count if count else 0.0, "seconds": seconds, "error": error}
+
+def configs(memories=("dict",), alus=("fast",), engines=("run",)):   #every combination of the swept options
+    return [{"memory": m, "alu": a, "engine": e} for m, a, e in itertools.product(memories, alus, engines)]
+
+def failed(run, e):     #the result of a run whose worker raised or died
+    name, config = run
+    label = "%s/%s/%s" % (config["memory"], config["alu"], config["engine"])
+    return result(name, label, 0, 0, 0, 0.0, "worker failed: %s" % (str(e) or type(e).__name__))
+
+def runbatch(filenames, jobs=None, sweep=None, limit=None):     #results in the order of filenames, then of sweep
+    sweep = sweep or configs()
+    runs = [(name, config) for name in filenames for config in sweep]
+    results = [None] * len(runs)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(runprogram, name, limit=limit, **config) for name, config in runs]
+        for index, future in enumerate(futures):
+            try:
+                results[index] = future.result()
+            except BrokenProcessPool:   #left for the runs one at a time below
+                pass
+            except Exception as e:
+                results[index] = failed(runs[index], e)
+    pool = None     #a worker died while these were in the pool, any of them may have killed it
+    for index in [i for i, r in enumerate(results) if r is None]:
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=1)
+        try:
+            results[index] = pool.submit(runprogram, runs[index][0], limit=limit, **runs[index][1]).result()
+        except BrokenProcessPool as e:  #the only run in flight killed the worker, the next ones get a new pool
+            results[index] = failed(runs[index], e)
+            pool.shutdown()
+            pool = None
+        except Exception as e:
+            results[index] = failed(runs[index], e)
+    if pool is not None:
+        pool.shutdown()
+    return results
+
+def printtable(results, out=sys.stdout):
+    width = max([len("program")] + [len(r["program"]) for r in results])
+    cwidth = max([len("config")] + [len(r["config"]) for r in results])
+    line = "%-*s  %-*s%14s%14s%12s%8s%10s  %s\n"
+    out.write(line % (width, "program", cwidth, "config", "instructions", "cycles", "stalls", "CPI", "seconds", "error"))
+    line = "%-*s  %-*s%14d%14d%12d%8.3f%10.3f  %s\n"
+    for r in results:
+        out.write(line % (width, r["program"], cwidth, r["config"], r["instructions"], r["cycles"], r["stalls"], r["cpi"], r["seconds"], r["error"]))
+    count = sum(r["instructions"] for r in results)
+    cycles = sum(r["cycles"] for r in results)
+    out.write(line % (width, "TOTAL", cwidth, "", count, cycles, sum(r["stalls"] for r in results),
+              cycles / count if count else 0.0, sum(r["seconds"] for r in results), "%d failed" % (sum(1 for r in results if r["error"]))))
+
+def writecsv(results, path):
+    with open(path, "w", newline="") as out:
+        w = csv.DictWriter(out, fieldnames=fields)
+        w.writeheader()
+        w.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="emulate and time many programs in parallel")
+    parser.add_argument("programs", nargs="+", help="directories of .a files (like testcases), globs or files")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--memory", nargs="+", choices=sorted(mem.memories), default=["dict"], help="data memory implementations")
+    parser.add_argument("--alu", nargs="+", choices=["ctypes", "fast"], default=["fast"], help="op implementations")
+    parser.add_argument("--engine", nargs="+", choices=["run", "runblocks"], default=["run"], help="machine run methods")
+    parser.add_argument("--limit", metavar="N", type=int, help="fail a program that is still running after N instructions")
+    parser.add_argument("--csv", metavar="FILE", help="also write the results to FILE as csv")
+    args = parser.parse_args()
+    results = runbatch(findprograms(args.programs), args.jobs, configs(args.memory, args.alu, args.engine), args.limit)
+    printtable(results)
+    if args.csv is not None:
+        writecsv(results, args.csv)
+    sys.exit(1 if any(r["error"] for r in results) else 0)
@@ -0,0 +1,360 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import tempfile
+import timeit
+import resource
+import platform
+import subprocess
+import tracemalloc
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import emulator     #the RISC-V emulator to be measured
+import hazard
+import tracebuf
+import mem
+import ops
+import fastops
+import checkpoint
+import assembler
+import dcache
+import workloads
+
+jumps = ("beq", "bne", "blt", "bge", "bltu", "bgeu", "jal", "jalr")    #programs with these are loops or recursion and are scaled by their input
+
+#the programs in testcases run only a few dozen instructions, so they are scaled up before being timed.
+#straight-line programs are repeated, while loops and recursion get their first input constant
+#(the first "addi rd, x0, n" that does not set the stack pointer) multiplied by the factor
+def scaleprogram(lines, factor):
+    tokens = [line.replace(",", " ").replace("(", " ").replace(")", " ").split() for line in lines]
+    if not any(text and text[0] in jumps for text in tokens):
+        return lines * factor
+    scaled = list(lines)
+    for i, text in enumerate(tokens):
+        if len(text) == 4 and text[0] == "addi" and text[2] in ("x0", "zero") and text[1] not in ("sp", "x2"):
+            scaled[i] = "addi %s, %s, %d\n" % (text[1], text[2], int(text[3]) * factor)
+            break
+    return scaled
+
+def writeprogram(lines):    #the machine reads its program from a file, so scaled programs are written to a temporary one
+    fd, path = tempfile.mkstemp(suffix=".a")
+    with os.fdopen(fd, "w") as out:
+        out.writelines(line if line.endswith("\n") else line + "\n" for line in lines)
+    return path
+
+def timerun(filename, method="run", repeat=3, **kwargs):   #returns the number of instructions and the best wall time of a few runs,
+    #kwargs go to the machine
+    best = None
+    for i in range(repeat):
+        mac = emulator.machine(filename, **kwargs)
+        start = time.perf_counter()
+        getattr(mac, method)()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return mac.counter, best
+
+def benchdecode(args):  #instructions per second of the original text interpreter (runtext with the ctypes ops) against the decoded run
+    print("%-12s%12s%16s%16s%10s" % ("program", "insts", "text inst/s", "decoded inst/s", "speedup"))
+    for name in sorted(glob.glob(os.path.join(args.dir, "*.a"))):
+        with open(name) as inp:
+            path = writeprogram(scaleprogram(inp.readlines(), args.factor))
+        try:
+            count, slow = timerun(path, "runtext", args.repeat, alu=ops)
+            count, fast = timerun(path, "run", args.repeat)
+        finally:
+            os.remove(path)
+        print("%-12s%12d%16.0f%16.0f%9.2fx" % (os.path.basename(name), count, count / slow, count / fast, slow / fast))
+
+def benchblocks(args):  #the decoded run against the block engine, with the hits and misses of the block cache
+    print("%-12s%12s%16s%16s%10s%10s%8s" % ("program", "insts", "decoded inst/s", "blocks inst/s", "speedup", "hits", "misses"))
+    for name in sorted(glob.glob(os.path.join(args.dir, "*.a"))):
+        with open(name) as inp:
+            path = writeprogram(scaleprogram(inp.readlines(), args.factor))
+        try:
+            count, slow = timerun(path, "run", args.repeat)
+            count, fast = timerun(path, "runblocks", args.repeat)
+            mac = emulator.machine(path)
+            mac.runblocks()
+        finally:
+            os.remove(path)
+        print("%-12s%12d%16.0f%16.0f%9.2fx%10d%8d" % (os.path.basename(name), count, count / slow, count / fast, slow / fast, mac.blocks.hits, mac.blocks.misses))
+
+def benchmemory(args):  #word stores and loads, and byte loads, called directly on every data memory implementation, and the memory they take
+    rng = random.Random(0)
+    addrs = [rng.randrange(args.span // 4) * 4 for i in range(args.accesses)]
+    print("%-8s%14s%14s%14s%12s" % ("memory", "sw/s", "lw/s", "lb/s", "MiB"))
+    for name in sorted(mem.memories):
+        tracemalloc.start()     #the size is measured on a separate fill, as tracing allocations slows them down
+        data = mem.memories[name]()
+        for addr in addrs:
+            data.writeword(addr, addr)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        data = mem.memories[name]()
+        start = time.perf_counter()
+        for addr in addrs:
+            data.writeword(addr, addr)
+        stores = time.perf_counter() - start
+        start = time.perf_counter()
+        for addr in addrs:
+            data.getword(addr)
+        loads = time.perf_counter() - start
+        start = time.perf_counter()
+        for addr in addrs:
+            data.get(addr + 1)
+        bytes = time.perf_counter() - start
+        n = len(addrs)
+        print("%-8s%14.0f%14.0f%14.0f%12.2f" % (name, n / stores, n / loads, n / bytes, size / 1048576))
+
+def benchops(args):     #cost of one call of every op in ops (ctypes) and fastops
+    data = mem.datamemory()
+    data.writeword(64, 0x89abcdef)
+    print("%-8s%12s%12s%10s" % ("op", "ctypes ns", "fast ns", "speedup"))
+    for name in fastops.alus + fastops.branches + fastops.loads + fastops.stores:
+        if name in fastops.loads:
+            operands = (data, 64)
+        elif name in fastops.stores:
+            operands = (data, 64, -5)
+        elif name in fastops.branches:
+            operands = (0xfffffff0, 7, 16)
+        else:
+            operands = (0xfffffff0, 7)
+        times = []
+        for module in (ops, fastops):
+            fn = getattr(module, "op" + name)
+            best = min(timeit.repeat(lambda: fn(*operands), number=args.calls, repeat=3))
+            times.append(best / args.calls * 1e9)
+        print("%-8s%12.0f%12.0f%9.2fx" % (name, times[0], times[1], times[0] / times[1]))
+
+def benchtiming(args):  #the per-entry hazard.timer against the numpy engine of hazardvec on one long trace
+    import hazardvec
+    with open(args.program) as inp:
+        path = writeprogram(scaleprogram(inp.readlines(), args.factor))
+    try:
+        mac = emulator.machine(path)
+        mac.run()
+    finally:
+        os.remove(path)
+    trace = tracebuf.tracebuffer()
+    for inst in mac.dump:
+        trace.append(inst)
+    start = time.perf_counter()
+    timing = hazard.timer()
+    for inst in mac.dump:
+        timing.push(inst)
+    timing.finish()
+    slow = time.perf_counter() - start
+    start = time.perf_counter()
+    result = hazardvec.timeTrace(trace)
+    fast = time.perf_counter() - start
+    print("%d instructions, %d clocks (timer) %d clocks (vector)" % (timing.count, timing.clock, result.clock))
+    print("timer %.3fs, vector %.3fs, %.1fx" % (slow, fast, slow / fast))
+
+def benchload(args):    #time to make a machine from a long program: text, binary image, and with the decoded program cached
+    with open(args.program) as inp:
+        path = writeprogram(inp.readlines() * args.factor)
+    image = path[:-2] + ".bin"
+    cache = tempfile.mkdtemp()
+    try:
+        assembler.writeimage(emulator.machine(path).instmem.values(), image)
+        print("%d instructions" % (args.factor * len(open(args.program).readlines())))
+        for label, filename, kwargs in (("text", path, {}), ("binary image", image, {}), ("text, cached", path, {"cache": cache})):
+            emulator.machine(filename, **kwargs)    #fills the cache, and the page cache for every case
+            start = time.perf_counter()
+            for i in range(args.repeat):
+                emulator.machine(filename, **kwargs)
+            print("%-14s%10.3fs" % (label, (time.perf_counter() - start) / args.repeat))
+    finally:
+        os.remove(path)
+        if os.path.exists(image):
+            os.remove(image)
+        shutil.rmtree(cache)
+
+def benchdcache(args):  #accesses per second of the data cache model, for a streaming and a random address pattern
+    rng = random.Random(0)
+    patterns = (("stream", [4 * i for i in range(args.accesses)]),
+                ("random", [rng.randrange(args.span // 4) * 4 for i in range(args.accesses)]))
+    print("%-8s%-32s%14s%10s" % ("pattern", "cache", "accesses/s", "hit %"))
+    for label, addrs in patterns:
+        for ways in (1, 4):
+            cache = dcache.datacache(args.size, ways, args.line)
+            start = time.perf_counter()
+            for i, addr in enumerate(addrs):
+                cache.access(addr, i & 3 == 0)     #every fourth access a store
+            elapsed = time.perf_counter() - start
+            print("%-8s%-32s%14.0f%10.2f" % (label, cache.name(), len(addrs) / elapsed, 100.0 * (1.0 - cache.missrate())))
+
+def measureworkload(name, scale, repeat):  #runs in a fresh process, so that its peak RSS is its own
+    fd, path = tempfile.mkstemp(suffix=".s")
+    os.close(fd)
+    try:
+        workloads.writeworkload(name, path, scale)
+        best = None
+        for i in range(repeat):
+            mac = emulator.machine(path)
+            start = time.perf_counter()
+            mac.run()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best, kept = elapsed, mac
+        start = time.perf_counter()
+        timing = hazard.hazardDetector(kept.dump)
+        analysis = time.perf_counter() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     #KiB on Linux
+        kept = mac = None
+        tracemalloc.start()     #the dump and the data memory are measured apart, on runs of their own
+        mac = emulator.machine(path, sink=lambda inst: None)
+        mac.run()
+        datamem = tracemalloc.get_traced_memory()[0]
+        mac = emulator.machine(path)
+        before = tracemalloc.get_traced_memory()[0]
+        mac.run()
+        dump = tracemalloc.get_traced_memory()[0] - before - datamem
+        tracemalloc.stop()
+    finally:
+        os.remove(path)
+    return {"instructions": timing.count, "cycles": timing.clock, "seconds": best, "ips": timing.count / best,
+            "hazard_seconds": analysis, "dump_mib": dump / 1048576, "datamem_mib": datamem / 1048576, "peak_rss_mib": rss}
+
+def version():      #the commit the tree is at, if it is a git checkout
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def regressions(previous, results, threshold):  #workloads whose speed fell or whose analysis time rose by more than threshold
+    found = []
+    for name, now in results.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        if now["ips"] < before["ips"] * (1 - threshold):
+            found.append("%s: %.0f instructions/s, was %.0f" % (name, now["ips"], before["ips"]))
+        if now["hazard_seconds"] > before["hazard_seconds"] * (1 + threshold):
+            found.append("%s: hazard analysis %.3fs, was %.3fs" % (name, now["hazard_seconds"], before["hazard_seconds"]))
+    return found
+
+def benchsuite(args):   #the synthetic workloads, each in a fresh process, compared with and appended to a JSON history
+    names = args.only or sorted(workloads.generators)
+    results = dict()
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(measureworkload, name, args.scale, args.repeat).result()
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as inp:
+            history = json.load(inp)
+    previous = next((r for r in reversed(history) if r["scale"] == args.scale), None)
+    print("%-10s%12s%12s%14s%12s%10s%12s%10s%10s" % ("workload", "insts", "cycles", "inst/s", "change", "hazard s", "dump MiB", "data MiB", "RSS MiB"))
+    for name in names:
+        r = results[name]
+        change = ""
+        if previous is not None and name in previous["results"]:
+            change = "%+.1f%%" % (100.0 * (r["ips"] / previous["results"][name]["ips"] - 1))
+        print("%-10s%12d%12d%14.0f%12s%10.3f%12.2f%10.2f%10.1f" % (name, r["instructions"], r["cycles"], r["ips"], change,
+              r["hazard_seconds"], r["dump_mib"], r["datamem_mib"], r["peak_rss_mib"]))
+    found = regressions(previous["results"], results, args.threshold) if previous is not None else []
+    for line in found:
+        print("REGRESSION %s" % (line))
+    if previous is not None:
+        print("compared with %s of %s" % (previous["version"], previous["date"]))
+    if not args.dry_run:
+        history.append({"version": version(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                        "scale": args.scale, "results": results})
+        with open(args.history, "w") as out:
+            json.dump(history, out, indent=1)
+    return 1 if found else 0
+
+def benchsnapshot(args):    #cost of a snapshot as the data memory grows, with the stores after it that have to copy shared pages,
+    #and of saving it whole or, for pagedmemory, as a delta of the one page written since the last checkpoint
+    mac = emulator.machine(args.program)
+    path = os.path.join(tempfile.mkdtemp(), "bench.rvck")
+    print("%-8s%12s%14s%16s%12s%12s%12s%12s" % ("memory", "KiB", "snapshot us", "store after us", "save ms", "file KiB", "delta ms", "delta KiB"))
+    for name in sorted(mem.memories):
+        for size in args.sizes:
+            mac.datamem = mem.memories[name]()
+            for addr in range(0, size * 1024, 4):
+                mac.datamem.writeword(addr, addr)
+            snap = checkpoint.take(mac)
+            start = time.perf_counter()
+            for i in range(args.repeat):
+                snap = checkpoint.take(mac)
+            taking = (time.perf_counter() - start) / args.repeat
+            storing = 0.0
+            for i in range(args.repeat):    #a store into a different page after every snapshot, the worst case for copy-on-write
+                checkpoint.take(mac)
+                start = time.perf_counter()
+                mac.datamem.writeword((i * 4096) % (size * 1024), i)
+                storing += time.perf_counter() - start
+            storing /= args.repeat
+            snap = checkpoint.take(mac)
+            start = time.perf_counter()
+            checkpoint.save(snap, path)
+            saving = time.perf_counter() - start
+            whole = os.path.getsize(path)
+            delta = "%12s%12s" % ("-", "-")
+            if snap.changed is not None:
+                mac.datamem.writeword(0, 1)
+                start = time.perf_counter()
+                checkpoint.append(checkpoint.take(mac), path)
+                delta = "%12.2f%12.1f" % ((time.perf_counter() - start) * 1e3, (os.path.getsize(path) - whole) / 1024)
+            print("%-8s%12d%14.1f%16.1f%12.2f%12.1f%s" % (name, size, taking * 1e6, storing * 1e6, saving * 1e3, whole / 1024, delta))
+    os.remove(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="performance measurements for the datapath simulator")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("decode", help="text interpreter against the pre-decoded run on the scaled testcases")
+    p.add_argument("--dir", default="testcases", help="directory of .a programs to scale and run")
+    p.add_argument("--factor", type=int, default=2000, help="how much to scale every program up")
+    p.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is reported")
+    p.set_defaults(func=benchdecode)
+    p = sub.add_parser("blocks", help="pre-decoded run against the block engine on the scaled testcases")
+    p.add_argument("--dir", default="testcases", help="directory of .a programs to scale and run")
+    p.add_argument("--factor", type=int, default=2000, help="how much to scale every program up")
+    p.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is reported")
+    p.set_defaults(func=benchblocks)
+    p = sub.add_parser("memory", help="loads and stores on every data memory implementation")
+    p.add_argument("--accesses", type=int, default=200000, help="number of accesses of each kind")
+    p.add_argument("--span", type=int, default=1 << 20, help="bytes of address space the accesses are spread over")
+    p.set_defaults(func=benchmemory)
+    p = sub.add_parser("ops", help="per-call cost of the ctypes ops against fastops")
+    p.add_argument("--calls", type=int, default=200000, help="calls per measurement")
+    p.set_defaults(func=benchops)
+    p = sub.add_parser("timing", help="per-entry timing model against the numpy one on a scaled program")
+    p.add_argument("--program", default="testcases/fact.a", help="program to scale up and trace")
+    p.add_argument("--factor", type=int, default=20000, help="how much to scale the program up")
+    p.set_defaults(func=benchtiming)
+    p = sub.add_parser("load", help="making a machine from a long program, from text, a binary image or the cache")
+    p.add_argument("--program", default="testcases/inp.a", help="program to repeat")
+    p.add_argument("--factor", type=int, default=20000, help="how many times to repeat it")
+    p.add_argument("--repeat", type=int, default=3, help="loads per measurement")
+    p.set_defaults(func=benchload)
+    p = sub.add_parser("dcache", help="throughput of the data cache model")
+    p.add_argument("--accesses", type=int, default=1000000, help="number of accesses per pattern")
+    p.add_argument("--span", type=int, default=1 << 20, help="bytes of address space the random accesses are spread over")
+    p.add_argument("--size", type=int, default=32768, help="cache size in bytes")
+    p.add_argument("--line", type=int, default=64, help="line size in bytes")
+    p.set_defaults(func=benchdcache)
+    p = sub.add_parser("suite", help="synthetic workloads with a JSON history to find performance regressions")
+    p.add_argument("--scale", type=float, default=1.0, help="multiplies the size of every workload")
+    p.add_argument("--only", nargs="+", choices=sorted(workloads.generators), help="only these workloads")
+    p.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is reported")
+    p.add_argument("--history", default="benchhistory.json", help="JSON file the results are compared with and appended to")
+    p.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    p.add_argument("--dry-run", action="store_true", help="compare without appending to the history")
+    p.set_defaults(func=benchsuite)
+    p = sub.add_parser("snapshot", help="checkpoint cost on every data memory implementation as it grows")
+    p.add_argument("--program", default="testcases/fact.a", help="program the machine is made from")
+    p.add_argument("--sizes", type=int, nargs="+", default=[16, 256, 1024, 4096], help="KiB of data memory written before the snapshots")
+    p.add_argument("--repeat", type=int, default=20, help="snapshots per measurement")
+    p.set_defaults(func=benchsnapshot)
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
@@ -0,0 +1,132 @@
+import emulator
+
+#the block engine of the emulator (see machine.runblocks). a basic block is the straight-line run of decoded
+#instructions from an entry PC up to and including the first branch, jal or jalr. every block is compiled
+#into a python function doing all of its instructions, with registers, immediates and ops functions
+#resolved in the generated source, and is cached by its entry PC. compiling costs much more than running
+#a block once, so a block is only compiled when it is entered for the threshold-th time
+
+maxlength = 64          #longer straight-line code is cut into several blocks
+threshold = 2           #entries into a block before it is compiled, the ones before are single instruction steps
+enders = (emulator.machine.doBranch, emulator.machine.doJal, emulator.machine.doJalr)
+
+class blockcache:
+    def __init__(self, mac):
+        self.mac = mac
+        self.blocks = dict()    #entry PC -> compiled function
+        self.spans = dict()     #entry PC -> (first PC, last PC) to find the blocks to drop in invalidate
+        self.visits = dict()    #entry PC -> times entered while not compiled yet, dropped for the PCs inside a compiled block
+        self.hits = 0           #dispatches to a compiled block
+        self.misses = 0         #blocks compiled
+        self.steps = 0          #single instructions run while their block was cold
+
+    def invalidate(self, pc=None):  #drops every block, or only those containing the instruction at pc. to be called if decoded changes
+        if pc is None:
+            self.blocks.clear()
+            self.spans.clear()
+            self.visits.clear()
+            return
+        for entry, (first, last) in list(self.spans.items()):
+            if first <= pc <= last:
+                del self.blocks[entry]
+                del self.spans[entry]
+
+    def lookup(self, pc):   #the function for the block at pc (compiling it on a miss), or None if there is no instruction there
+        fn = self.blocks.get(pc)
+        if fn is not None:
+            self.hits += 1
+            return fn
+        decoded = self.mac.decoded
+        if pc < 0 or pc & 3 or (pc >> 2) >= len(decoded) or decoded[pc >> 2] is None:
+            return None
+        visits = self.visits.get(pc, 0) + 1
+        if visits < threshold:
+            self.visits[pc] = visits
+            self.steps += 1
+            return step
+        self.visits.pop(pc, None)
+        self.misses += 1
+        recs = []
+        addr = pc
+        while (addr >> 2) < len(decoded) and len(recs) < maxlength:
+            rec = decoded[addr >> 2]
+            if rec is None or rec[0] is emulator.machine.doInvalid:
+                break
+            recs.append((addr, rec))
+            if rec[0] in enders:
+                break
+            addr += 4
+        if recs:
+            fn = compileblock(recs)
+            last = recs[-1][0]
+        else:   #a line that failed to decode is run on its own, so it raises its error like in machine.run
+            fn = step
+            last = pc
+        self.blocks[pc] = fn
+        self.spans[pc] = (pc, last)
+        for addr in range(pc + 4, last + 4, 4):    #the instructions stepped while the block was cold are not entries
+            self.visits.pop(addr, None)
+        return fn
+
+
+def step(mac):  #runs the one instruction at PC like machine.run does
+    rec = mac.decoded[mac.PC >> 2]
+    rec[0](mac, rec)
+
+
+def compileblock(recs):     #generates and compiles the source of one block, see the handlers in emulator for what each line does
+    env = dict()            #the ops functions used by the block
+    lines = ["def block(mac):",
+             "    R = mac.reg.storage",     #register 0 is never written, so reading the storage directly always gives 0 for it
+             "    M = mac.datamem",
+             "    emit = mac.emit",
+             "    c = mac.counter",
+             "    pc = %d" % (recs[0][0]),
+             "    try:"]
+    ind = "        "
+    for addr, (handler, op, d, s1, s2, imm, fn) in recs:
+        f = "f%d" % (len(env))
+        env[f] = fn
+        lines.append(ind + "pc = %d" % (addr))     #kept up to date so that a failing instruction leaves PC at itself
+        lines.append(ind + "c += 1")
+        write = (ind + "R[%d] = r" % (d)) if d > 0 else None
+        if handler is emulator.machine.doRtype:
+            lines.append(ind + "a1 = R[%d]; a2 = R[%d]; r = %s(a1, a2)" % (s1, s2, f))
+            if write: lines.append(write)
+            lines.append(ind + "emit([(%d, c), %r, (%d, r), (%d, a1), (%d, a2), (-1, -1)])" % (addr, op, d, s1, s2))
+        elif handler is emulator.machine.doItype:
+            lines.append(ind + "a1 = R[%d]; r = %s(a1, %d)" % (s1, f, imm))
+            if write: lines.append(write)
+            lines.append(ind + "emit([(%d, c), %r, (%d, r), (%d, a1), (%d, %d), (-1, -1)])" % (addr, op, d, s1, s2, imm))
+        elif handler is emulator.machine.doLoad:
+            lines.append(ind + "a1 = R[%d]; r = %s(M, a1 + %d)" % (s1, f, imm))
+            if write: lines.append(write)
+            lines.append(ind + "emit([(%d, c), %r, (%d, r), (%d, a1), (%d, %d), (-1, -1)])" % (addr, op, d, s1, s2, imm))
+        elif handler is emulator.machine.doStore:
+            lines.append(ind + "a1 = R[%d]; a2 = R[%d]; %s(M, %d + a2, a1)" % (s1, s2, f, imm))
+            lines.append(ind + "emit([(%d, c), %r, (-1, %d), (%d, a1), (%d, a2), (-1, -1)])" % (addr, op, imm, s1, s2))
+        elif handler is emulator.machine.doBranch:
+            lines.append(ind + "a1 = R[%d]; a2 = R[%d]; r = %s(a1, a2, %d)" % (s1, s2, f, imm))
+            lines.append(ind + "emit([(%d, c), %r, (-1, r), (%d, a1), (%d, a2), (-1, -1)])" % (addr, op, s1, s2))
+            lines.append(ind + "pc = %d + r" % (addr))
+        elif handler is emulator.machine.doJal:
+            if d > 0: lines.append(ind + "R[%d] = %d" % (d, addr + 4))
+            lines.append(ind + "emit([(%d, c), %r, (%d, %d), (0, 0), (-1, %d), (-1, -1)])" % (addr, op, d, addr + 4, imm))
+            lines.append(ind + "pc = %d" % (addr + imm))
+        elif handler is emulator.machine.doJalr:
+            lines.append(ind + "a1 = R[%d]" % (s1))
+            if d > 0: lines.append(ind + "R[%d] = %d" % (d, addr + 4))
+            lines.append(ind + "emit([(%d, c), %r, (%d, %d), (%d, a1), (%d, %d), (-1, -1)])" % (addr, op, d, addr + 4, s1, s2, imm))
+            lines.append(ind + "pc = %d + a1 + %d" % (addr, imm))
+        elif handler is emulator.machine.doLui or handler is emulator.machine.doAuipc:
+            result = (imm << 12) if handler is emulator.machine.doLui else (imm << 12) + addr
+            if d > 0: lines.append(ind + "R[%d] = %d" % (d, result))
+            lines.append(ind + "emit([(%d, c), %r, (%d, %d), (0, 0), (-1, %d), (-1, -1)])" % (addr, op, d, result, imm))
+        #doNop only counts the instruction
+    if recs[-1][1][0] not in enders:
+        lines.append(ind + "pc = %d" % (recs[-1][0] + 4))
+    lines += ["    finally:",
+              "        mac.counter = c",
+              "        mac.PC = pc"]
+    exec(compile("\n".join(lines), "<block %d>" % (recs[0][0]), "exec"), env)
+    return env["block"]
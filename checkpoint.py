@@ -0,0 +1,178 @@
+import os
+import sys
+import zlib
+import struct
+import hashlib
+from array import array
+import mem
+
+#snapshots of a machine (PC, counter, registers and data memory) that can be restored later, also in another
+#process from a file. taking one is cheap: datamemory is copied as a dictionary of ints, and pagedmemory only
+#hands its pages over and copies them again when it writes them (see pagedmemory.snapshot).
+#the trace is not part of a snapshot, a resumed machine starts with an empty dump and its counter where it was.
+#a checkpoint file is the magic and a version byte, then records of a length (I) and a zlib compressed state:
+#   pc, counter, whether it is a delta, memory kind, sha1 of the program, the 32 registers as length-prefixed signed
+#   integers, then
+#   datamemory: the number of bytes, their addresses (q) and values (B)
+#   pagedmemory: the number of pages and for every page its number (q), its 4096 bytes and its 4096 written flags
+#the first record has all of memory. a delta record of a pagedmemory only has the pages written since the record
+#before it, and is appended to the file, so saving a checkpoint costs the pages written since the last one and
+#not the whole memory. loading applies the records in order, a record cut short by a crash is ignored.
+
+magic = b"RVCK"
+version = 2
+kinds = dict((cls, name) for name, cls in mem.memories.items())    #memory class -> name in mem.memories
+
+class snapshot:
+    def __init__(self, pc, counter, regs, kind, memory, program, changed=None):
+        self.pc = pc
+        self.counter = counter
+        self.regs = regs            #tuple of the 32 register values
+        self.kind = kind            #"dict" or "paged", the memory it was taken from and can be restored to
+        self.memory = memory        #the state from the snapshot method of that memory
+        self.program = program      #sha1 of the instruction memory, so it is not restored onto another program
+        self.changed = changed      #for a pagedmemory, the pages written since the snapshot before it
+
+def programhash(mac):
+    h = hashlib.sha1()
+    for addr in sorted(mac.instmem):
+        h.update(" ".join(mac.instmem[addr]).encode())
+        h.update(b"\n")
+    return h.digest()
+
+def take(mac, program=None):    #program is the programhash of mac, given by callers taking many snapshots
+    kind = kinds.get(type(mac.datamem))
+    if kind is None:
+        raise Exception("Can not snapshot this data memory!")
+    changed = mac.datamem.changed() if kind == "paged" else None
+    return snapshot(mac.PC, mac.counter, tuple(mac.reg.storage), kind, mac.datamem.snapshot(), program or programhash(mac), changed)
+
+def restore(mac, snap):     #the machine has to be made from the same program, with the same kind of memory
+    if snap.program != programhash(mac):
+        raise Exception("Checkpoint is of another program!")
+    if kinds.get(type(mac.datamem)) != snap.kind:
+        raise Exception("Checkpoint is of a %s memory!" % (snap.kind))
+    mac.PC = snap.pc
+    mac.counter = snap.counter
+    mac.reg.storage[:] = snap.regs  #in place, compiled blocks read the same list
+    mac.datamem.restore(snap.memory)
+
+def packint(value):
+    data = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+    return struct.pack("<B", len(data)) + data
+
+def unpackint(payload, offset):
+    size = payload[offset]
+    return int.from_bytes(payload[offset + 1:offset + 1 + size], "little", signed=True), offset + 1 + size
+
+def encode(snap, delta=False):     #with delta, only the changed pages of a pagedmemory snapshot
+    kind = snap.kind.encode()
+    parts = [struct.pack("<qqBB", snap.pc, snap.counter, delta, len(kind)), kind, snap.program]
+    parts += [packint(value) for value in snap.regs]
+    if snap.kind == "dict":
+        addrs = array("q", sorted(snap.memory))
+        values = array("B", [snap.memory[a] for a in addrs])
+        parts += [struct.pack("<q", len(addrs)), addrs.tobytes(), values.tobytes()]
+    else:
+        pages, written = snap.memory
+        numbers = snap.changed if delta else sorted(pages)
+        parts.append(struct.pack("<q", len(numbers)))
+        for number in numbers:
+            parts += [struct.pack("<q", number), bytes(pages[number]), bytes(written[number])]
+    return b"".join(parts)
+
+def decode(payload):       #the snapshot and whether it is a delta
+    pc, counter, delta, size = struct.unpack_from("<qqBB", payload, 0)
+    offset = struct.calcsize("<qqBB")
+    kind = payload[offset:offset + size].decode()
+    offset += size
+    program = payload[offset:offset + 20]
+    offset += 20
+    regs = []
+    for i in range(32):
+        value, offset = unpackint(payload, offset)
+        regs.append(value)
+    count, = struct.unpack_from("<q", payload, offset)
+    offset += 8
+    if kind == "dict":
+        addrs = array("q")
+        addrs.frombytes(payload[offset:offset + 8 * count])
+        if sys.byteorder != "little":
+            addrs.byteswap()
+        values = payload[offset + 8 * count:offset + 9 * count]
+        memory = dict(zip(addrs, values))
+    elif kind == "paged":
+        pages, written = dict(), dict()
+        for i in range(count):
+            number, = struct.unpack_from("<q", payload, offset)
+            pages[number] = bytearray(payload[offset + 8:offset + 8 + 4096])
+            written[number] = bytearray(payload[offset + 8 + 4096:offset + 8 + 8192])
+            offset += 8 + 8192
+        memory = (pages, written)
+    else:
+        raise Exception("Unknown memory in checkpoint!")
+    return snapshot(pc, counter, tuple(regs), kind, memory, program), delta
+
+def record(snap, delta=False):
+    data = zlib.compress(encode(snap, delta), 1)
+    return struct.pack("<I", len(data)) + data
+
+def save(snap, path):       #the whole snapshot, written next to path and renamed over it, so a crash while saving leaves the previous checkpoint
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(magic + bytes([version]) + record(snap))
+    os.replace(temp, path)
+
+def append(snap, path):     #adds the pages of a pagedmemory snapshot written since the previous one to a file made by save
+    if snap.changed is None:
+        raise Exception("Only snapshots of a paged memory can be appended!")
+    with open(path, "ab") as f:
+        f.write(record(snap, True))
+
+def load(path):             #the snapshot of the last complete record
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != magic or len(data) < 5 or data[4] != version:
+        raise Exception("Not a checkpoint file!")
+    snap = None
+    offset = 5
+    while offset + 4 <= len(data):
+        size, = struct.unpack_from("<I", data, offset)
+        if offset + 4 + size > len(data):
+            break           #cut short while it was appended
+        last, delta = decode(zlib.decompress(data[offset + 4:offset + 4 + size]))
+        offset += 4 + size
+        if snap is None:
+            if delta:
+                raise Exception("Checkpoint file does not start with a whole snapshot!")
+        elif last.kind != snap.kind or last.program != snap.program:
+            raise Exception("Checkpoint records of different machines!")
+        elif delta:         #the pages it has replace the ones before, the others are kept
+            snap.memory[0].update(last.memory[0])
+            snap.memory[1].update(last.memory[1])
+            last.memory = snap.memory
+        snap = last
+    if snap is None:
+        raise Exception("Not a checkpoint file!")
+    return snap
+
+def runcheckpointed(mac, every, path, limit=None):   #run, saving a checkpoint to path every so many instructions. returns the last snapshot.
+    #with a limit, it throws like machine.run if the program still has instructions to run once the counter reaches limit.
+    #with a pagedmemory, the first checkpoint is saved whole and the next ones are appended as deltas, until the deltas
+    #add up to more than the whole one and the file is saved whole again
+    snap = None
+    program = programhash(mac)
+    whole = appended = 0
+    while mac.step(every if limit is None else min(every, limit - mac.counter)):
+        snap = take(mac, program)
+        if snap.changed is None or whole == 0 or appended > whole:
+            save(snap, path)
+            whole, appended = os.path.getsize(path), 0
+        else:
+            append(snap, path)
+            appended = os.path.getsize(path) - whole
+        if limit is not None and mac.counter >= limit:
+            if mac.fetchable():
+                raise Exception("Instruction limit of %d reached" % (limit))
+            break
+    return snap
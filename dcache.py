@@ -0,0 +1,199 @@
+import sys
+import argparse
+import itertools
+from array import array
+import emulator
+import hazard
+import tracebuf
+
+# A data cache model for the timing. The machine reads and writes its datamemory directly, and the cache only
+# sees the addresses the trace entries already carry: arg1 + immediate for loads, immediate + arg2 for stores.
+# Every access is a hit or a miss of a set-associative cache, and a miss costs penalty cycles to fill its line,
+# plus penalty again if a dirty line has to be written back first.
+#	write-back:	stores allocate their line and only mark it dirty
+#	write-through:	stores go to memory through a write buffer (no stall) and do not allocate on a miss
+# The tag store is a few flat arrays indexed by set * ways + way, and a dictionary from line address to its slot
+# finds hits without searching the set, so an access allocates nothing.
+
+loadType = hazard.loadType
+storeType = ["sb", "sh", "sw"]
+
+class datacache:
+	def __init__(self, size=4096, ways=2, line=32, policy="lru", write="back", penalty=20):
+		if line < 4 or line & (line - 1) or ways < 1 or size < line * ways or size % (line * ways) or (size // (line * ways)) & (size // (line * ways) - 1):
+			raise Exception("Cache line size and number of sets have to be powers of two!")
+		if policy not in ("lru", "fifo") or write not in ("back", "through"):
+			raise Exception("Unknown cache policy!")
+		self.size = size
+		self.ways = ways
+		self.line = line
+		self.policy = policy
+		self.write = write
+		self.penalty = penalty
+		self.sets = size // (line * ways)
+		self.shift = line.bit_length() - 1
+		self.lines = array("q", bytes(8 * self.sets * ways))	# line address held by every slot
+		self.stamps = array("q", bytes(8 * self.sets * ways))	# last use (lru) or fill (fifo), to pick the victim
+		self.valid = bytearray(self.sets * ways)
+		self.dirty = bytearray(self.sets * ways)
+		self.where = dict()		# line address -> slot, for the lines in the cache
+		self.time = 0
+		self.reads = 0
+		self.writes = 0
+		self.readmisses = 0
+		self.writemisses = 0
+		self.writebacks = 0		# dirty lines written back on eviction
+		self.memwrites = 0		# stores written through to memory
+		self.cycles = 0			# penalty cycles of all accesses
+
+	def name(self):
+		return "%dB/%dway/%dB/%s/%s" % (self.size, self.ways, self.line, self.policy, self.write)
+
+	def access(self, addr, write):	# the penalty cycles of one access
+		self.time += 1
+		number = addr >> self.shift
+		slot = self.where.get(number)
+		if write:
+			self.writes += 1
+			if self.write == "through":
+				self.memwrites += 1
+		else:
+			self.reads += 1
+		if slot is not None:
+			if self.policy == "lru":
+				self.stamps[slot] = self.time
+			if write and self.write == "back":
+				self.dirty[slot] = 1
+			return 0
+		if write:
+			self.writemisses += 1
+			if self.write == "through":
+				return 0	# no write allocate
+		else:
+			self.readmisses += 1
+		base = (number & (self.sets - 1)) * self.ways
+		victim = base
+		for slot in range(base, base + self.ways):
+			if not self.valid[slot]:
+				victim = slot
+				break
+			if self.stamps[slot] < self.stamps[victim]:
+				victim = slot
+		penalty = self.penalty
+		if self.valid[victim]:
+			del self.where[self.lines[victim]]
+			if self.dirty[victim]:
+				self.writebacks += 1
+				penalty += self.penalty
+		self.valid[victim] = 1
+		self.lines[victim] = number
+		self.stamps[victim] = self.time
+		self.dirty[victim] = 1 if write else 0
+		self.where[number] = victim
+		self.cycles += penalty
+		return penalty
+
+	def push(self, inst):	# takes one trace entry, the cache only needs the addresses
+		op = inst[1]
+		if op in loadType:
+			self.access(inst[3][1] + inst[4][1], False)
+		elif op in storeType:
+			self.access(inst[2][1] + inst[4][1], True)
+
+	def misses(self):
+		return self.readmisses + self.writemisses
+
+	def missrate(self):
+		accesses = self.reads + self.writes
+		return self.misses() / accesses if accesses else 0.0
+
+	def report(self, out=sys.stdout):
+		out.write("\n\n*******DATA CACHE******\n")
+		out.write("%s, %d sets, miss penalty %d cycles\n" % (self.name(), self.sets, self.penalty))
+		out.write("Loads:  %d, misses %d\n" % (self.reads, self.readmisses))
+		out.write("Stores:  %d, misses %d\n" % (self.writes, self.writemisses))
+		out.write("Hit rate:  %.2f%%\n" % (100.0 * (1.0 - self.missrate())))
+		out.write("Dirty lines written back:  %d\n" % (self.writebacks))
+		out.write("Stores written through:  %d\n" % (self.memwrites))
+		out.write("Cycles added by misses:  %d\n" % (self.cycles))
+
+
+class cachedtiming:	# a sink after a timing model (hazard.timer, online.pipeline): adds the penalties of the cache to the timing
+	# of every entry and to the totals. every penalty is a stall of the access, and moves the clock of everything after it
+	def __init__(self, cache, sink=None):
+		self.cache = cache
+		self.sink = sink
+		self.timing = None	# the timing model it follows, set once that is made, for the totals
+		self.added = 0
+
+	def push(self, inst):
+		op = inst[1]
+		penalty = 0
+		if op in loadType:
+			penalty = self.cache.access(inst[3][1] + inst[4][1], False)
+		elif op in storeType:
+			penalty = self.cache.access(inst[2][1] + inst[4][1], True)
+		self.added += penalty
+		if self.added:
+			clock, stall = inst[5]
+			inst[5] = (clock + self.added, stall + penalty)
+		if self.sink is not None:
+			self.sink(inst)
+
+	@property
+	def count(self):
+		return self.timing.count
+
+	@property
+	def clock(self):
+		return self.timing.clock + self.added
+
+	@property
+	def stalls(self):
+		return self.timing.stalls + self.added
+
+
+def parse(spec):	# "size=4096,ways=2,line=32,policy=lru,write=back,penalty=20", every part optional, to a datacache
+	kwargs = dict()
+	for part in filter(None, spec.split(",")):
+		key, _, value = part.partition("=")
+		if key not in ("size", "ways", "line", "policy", "write", "penalty"):
+			raise Exception("Unknown cache parameter %s!" % (key))
+		kwargs[key] = value if key in ("policy", "write") else int(value)
+	return datacache(**kwargs)
+
+def evaluate(trace, caches):	# runs one trace through every cache in a single pass
+	for inst in trace:
+		for cache in caches:
+			cache.push(inst)
+	return caches
+
+def printcaches(caches, out=sys.stdout):
+	out.write("%-32s%12s%12s%10s%12s%12s\n" % ("cache", "accesses", "misses", "hit %", "writebacks", "cycles"))
+	for c in caches:
+		out.write("%-32s%12d%12d%10.2f%12d%12d\n" % (c.name(), c.reads + c.writes, c.misses(), 100.0 * (1.0 - c.missrate()), c.writebacks, c.cycles))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="run the loads and stores of one trace through several data caches")
+	parser.add_argument("inputFileName", nargs="?", help="program to emulate")
+	parser.add_argument("--analyze", metavar="DIR", help="use a trace saved with main.py --trace instead of a program")
+	parser.add_argument("--size", type=int, nargs="+", default=[4096], help="bytes")
+	parser.add_argument("--ways", type=int, nargs="+", default=[2])
+	parser.add_argument("--line", type=int, nargs="+", default=[32], help="bytes")
+	parser.add_argument("--policy", choices=["lru", "fifo"], nargs="+", default=["lru"])
+	parser.add_argument("--write", choices=["back", "through"], nargs="+", default=["back"])
+	parser.add_argument("--penalty", type=int, default=20, help="cycles to fill a line")
+	args = parser.parse_args()
+	if args.analyze is not None:
+		trace = tracebuf.tracebuffer.load(args.analyze)
+	elif args.inputFileName is not None:
+		mac = emulator.machine(args.inputFileName)
+		try:
+			mac.run()
+		except Exception as e:
+			print("!!!!!!!!!!BUG!!!!!!!!!!!\n%s" % (str(e)))
+		trace = mac.dump
+	else:
+		parser.error("an input file or --analyze is needed")
+	caches = [datacache(s, w, l, p, wr, args.penalty) for s, w, l, p, wr in itertools.product(args.size, args.ways, args.line, args.policy, args.write)]
+	printcaches(evaluate(trace, caches))
@@ -1,24 +1,165 @@
-import ops
+import fastops
 import mem
+import assembler
+
+#instruction groups used by the decoder to pick a handler for each line of the program
+rtypes = ("add", "sub", "xor", "or", "and", "sll", "srl", "sra", "slt", "sltu")
+itypes = ("addi", "xori", "ori", "andi", "slli", "srli", "srai", "slti", "sltui")
+loadtypes = ("lb", "lh", "lw", "lbu", "lhu")
+storetypes = ("sb", "sh", "sw")
+branchtypes = ("beq", "bne", "blt", "bge", "bltu", "bgeu")
 
 class machine:
-    def __init__(self, filename):
-        self.instmem = dict()               #the instruction memory(holds instructions as tokenized input lines, indexed by the location in instruction memory)
-        self.datamem = mem.datamemory()     #the data memory, see mem module for implementation
+    __slots__ = ("instmem", "datamem", "reg", "alu", "dump", "emit", "decoded", "PC", "counter", "blocks")
+    def __init__(self, filename, sink=None, memory=mem.datamemory, alu=fastops, cache=None):
+        self.datamem = memory()             #the data memory, see mem module for implementations (mem.datamemory or mem.pagedmemory)
         self.reg = mem.regfile()            #the register file, see mem module for implementation
+        self.alu = alu                      #the module with the op functions used by decoded instructions: fastops, or the ctypes reference ops
         self.dump = list()                  #the dump list, which traces all the execution and is printed later
-        addr = int(0)                       #address to write the next instruction read from the input
-        inp = open(filename, "r")           #the file with instructions written
-        ##digest the input lines to instmem
-        while (True):
-            line = inp.readline()
-            if not line:
-                break
-            text = str(line).replace(",", " ").replace("(", " ").replace(")", " ").rsplit()  # a simple tokenizer. example output: ["add","x5","x0","x1"]
-            self.instmem[addr] = text
-            addr += 4
+        self.emit = self.dump.append if sink is None else sink  #every trace entry goes here. a sink (like hazard.timer.push) gets them one by one and the dump stays empty
+        ##read the program file into the instruction memory (holds instructions as tokenized input lines, indexed by the location
+        ##in instruction memory, see assembler for the file formats) and decode every line once, so execution does not have
+        ##to parse the tokens again (see decode and run). with a cache directory, a program read before is loaded already decoded
+        self.instmem, self.decoded = assembler.load(filename, self.decode, alu.__name__, cache)
         self.PC = 0                     #initialize PC for execution
         self.counter = 0                #initialize instruction counter (number of instructions executed)
+        self.blocks = None              #the cache of compiled basic blocks, made by the first runblocks
+
+    def decode(self, text): #turns the tokens of one line into a record (handler, op, d, s1, s2, imm, fn) with everything resolved
+        if (len(text) == 0):
+            return None                 #empty lines stop the execution, see run
+        op = text[0]
+        try:
+            if (op in rtypes):
+                return (machine.doRtype, op, self.regIdx(text[1]), self.regIdx(text[2]), self.regIdx(text[3]), 0, getattr(self.alu, "op" + op))
+            elif (op in itypes):
+                return (machine.doItype, op, self.regIdx(text[1]), self.regIdx(text[2]), -1, int(text[3]), getattr(self.alu, "op" + op[:len(op) - 1]))
+            elif (op in loadtypes):
+                return (machine.doLoad, op, self.regIdx(text[1]), self.regIdx(text[3]), -1, int(text[2]), getattr(self.alu, "op" + op))
+            elif (op in storetypes):
+                return (machine.doStore, op, -1, self.regIdx(text[1]), self.regIdx(text[3]), int(text[2]), getattr(self.alu, "op" + op))
+            elif (op in branchtypes):
+                return (machine.doBranch, op, -1, self.regIdx(text[1]), self.regIdx(text[2]), int(text[3]), getattr(self.alu, "op" + op))
+            elif (op == "jal"):
+                return (machine.doJal, op, self.regIdx(text[1]), 0, -1, int(text[2]), None)
+            elif (op == "jalr"):
+                return (machine.doJalr, op, self.regIdx(text[1]), self.regIdx(text[3]), -1, int(text[2]), None)
+            elif (op == "lui"):
+                return (machine.doLui, op, self.regIdx(text[1]), 0, -1, int(text[2]), None)
+            elif (op == "auipc"):
+                return (machine.doAuipc, op, self.regIdx(text[1]), 0, -1, int(text[2]), None)
+            elif (op == "ecall" or op == "ebreak"):
+                return (machine.doNop, op, -1, -1, -1, 0, None)
+            else:
+                raise Exception("Invalid instruction name")
+        except Exception as e:
+            #a bad line only breaks the program if it is ever executed, exactly like the text interpreter in instruction
+            return (machine.doInvalid, op, -1, -1, -1, 0, e)
+
+    #handlers for decoded records. each one does the same work and writes the same dump entry as its part of instruction.
+    #they use the list of the register file directly: register 0 is read as the 0 it always holds, and after a write
+    #it is set back to 0, which costs less than checking the destination of every write (see mem.regfile)
+    def doRtype(self, rec):
+        _, op, d, s1, s2, _, fn = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        arg2 = R[s2]
+        result = fn(arg1, arg2)
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += 4
+
+    def doItype(self, rec):
+        _, op, d, s1, s2, arg2, fn = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        result = fn(arg1, arg2)
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += 4
+
+    def doLoad(self, rec):
+        _, op, d, s1, s2, arg2, fn = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        result = fn(self.datamem, arg1 + arg2)
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += 4
+
+    def doStore(self, rec):
+        _, op, _, s1, s2, immptr, fn = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        arg2 = R[s2]
+        fn(self.datamem, immptr + arg2, arg1)
+        self.emit([(self.PC, self.counter), op, (-1, immptr), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += 4
+
+    def doBranch(self, rec):
+        _, op, _, s1, s2, immptr, fn = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        arg2 = R[s2]
+        offset = fn(arg1, arg2, immptr)
+        self.emit([(self.PC, self.counter), op, (-1, offset), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += offset
+
+    def doJal(self, rec):
+        _, op, d, _, _, offset, _ = rec
+        self.counter += 1
+        R = self.reg.storage
+        R[d] = self.PC + 4
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, self.PC + 4), (0, 0), (-1, offset), (-1, -1)])
+        self.PC += offset
+
+    def doJalr(self, rec):
+        _, op, d, s1, s2, arg2, _ = rec
+        self.counter += 1
+        R = self.reg.storage
+        arg1 = R[s1]
+        result = self.PC + 4
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+        self.PC += arg1 + arg2
+
+    def doLui(self, rec):
+        _, op, d, _, _, arg1, _ = rec
+        self.counter += 1
+        R = self.reg.storage
+        result = arg1 << 12
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
+        self.PC += 4
+
+    def doAuipc(self, rec):
+        _, op, d, _, _, arg1, _ = rec
+        self.counter += 1
+        R = self.reg.storage
+        result = (arg1 << 12) + self.PC
+        R[d] = result
+        R[0] = 0
+        self.emit([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
+        self.PC += 4
+
+    def doNop(self, rec):
+        self.counter += 1
+        self.PC += 4
+
+    def doInvalid(self, rec):
+        self.counter += 1
+        raise rec[6]                    #the error found while decoding this line
 
     def instruction(self, inputLine):  # the main function to process an instruction
         text = self.instmem[self.PC]  # read from instruction memory
@@ -31,9 +172,9 @@ class machine:
             arg1 = self.reg[s1]         #argument read from register
             s2 = self.regIdx(text[3])
             arg2 = self.reg[s2]
-            result = getattr(ops, "op" + op)(arg1, arg2)        #see ops file for logical implementation of most instructions
+            result = getattr(self.alu, "op" + op)(arg1, arg2)        #see ops file for logical implementation of most instructions
             self.reg[d] = result
-            self.dump.append([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])#this is the format used for dump NOTE: executor does not write timing, hazard module will do that
+            self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])#this is the format used for dump NOTE: executor does not write timing, hazard module will do that
             self.PC += 4
         elif (any([op == i for i in ["addi", "xori", "ori", "andi", "slli", "srli", "srai", "slti", "sltui"]])):
                                             #Process arithmetic Itype Instructions
@@ -43,9 +184,9 @@ class machine:
             s2 = -1                         #immediate arguments are traced as if from register -1
             arg2 = int(text[3])             #immediate argument directly read from the instruction
             immop = op[:len(op) - 1]        #get the logical operation name by removing i from op
-            result = getattr(ops, "op" + immop)(arg1, arg2)
+            result = getattr(self.alu, "op" + immop)(arg1, arg2)
             self.reg[d] = result
-            self.dump.append([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+            self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
             self.PC += 4
         elif (any([op == i for i in ["lb", "lh", "lw", "lbu", "lhu"]])):
                                             #Process load instructions
@@ -55,9 +196,9 @@ class machine:
             s2 = -1
             arg2 = int(text[2])
             location = arg1 + arg2
-            result = getattr(ops, "op" + op)(self.datamem, location)
+            result = getattr(self.alu, "op" + op)(self.datamem, location)
             self.reg[d] = result
-            self.dump.append([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+            self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
             self.PC += 4
         elif (any([op == i for i in ["sb", "sh", "sw"]])):
                                                 #Process Store instructions
@@ -67,9 +208,9 @@ class machine:
             arg2 = self.reg[s2]
             immptr = int(text[2])
             location = immptr + arg2
-            result = getattr(ops, "op" + op)(self.datamem, location,
+            result = getattr(self.alu, "op" + op)(self.datamem, location,
                                              arg1)  # what will be read from memory later is returned here
-            self.dump.append([(self.PC, self.counter), op, (-1, immptr), (s1, arg1), (s2, arg2), (-1, -1)]) #for S-Type instructions, we trace the immediate argument as an immediate destination
+            self.emit([(self.PC, self.counter), op, (-1, immptr), (s1, arg1), (s2, arg2), (-1, -1)]) #for S-Type instructions, we trace the immediate argument as an immediate destination
             self.PC += 4
         elif (any([op == i for i in ["beq", "bne", "blt", "bge", "bltu", "bgeu"]])):
                                                 #Process branch instructions
@@ -78,15 +219,15 @@ class machine:
             arg1 = self.reg[s1]
             arg2 = self.reg[s2]
             immptr = int(text[3])
-            offset = getattr(ops, "op" + op)(arg1, arg2, immptr)
-            self.dump.append([(self.PC, self.counter), op, (-1, offset), (s1, arg1), (s2, arg2), (-1, -1)])#The result is traced as the ofset decided to branch as immediate
+            offset = getattr(self.alu, "op" + op)(arg1, arg2, immptr)
+            self.emit([(self.PC, self.counter), op, (-1, offset), (s1, arg1), (s2, arg2), (-1, -1)])#The result is traced as the ofset decided to branch as immediate
             self.PC += offset
         elif (op == "jal"): 
                                                 #Jump and link is implemented here instead of in ops module
             d = self.regIdx(text[1])
             offset = int(text[2])
             self.reg[d] = self.PC + 4
-            self.dump.append([(self.PC, self.counter), op, (d, self.PC + 4), (0, 0), (-1, offset), (-1, -1)])#there is a single source, so we trace (0,0) for one of the sources
+            self.emit([(self.PC, self.counter), op, (d, self.PC + 4), (0, 0), (-1, offset), (-1, -1)])#there is a single source, so we trace (0,0) for one of the sources
             self.PC += offset                   #this is how jump happens
         elif (op == "jalr"):
                                                 #This instruction is also implemented here but fits our Rtype and Itype convention for source and destination tracing 
@@ -98,7 +239,7 @@ class machine:
             location = arg1 + arg2              #calculate where to jump
             result = self.PC + 4
             self.reg[d] = result
-            self.dump.append([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
+            self.emit([(self.PC, self.counter), op, (d, result), (s1, arg1), (s2, arg2), (-1, -1)])
             self.PC += arg1 + arg2              #implement the jump itself
         elif (op == "lui"):
                                                 #Load upper immediate is implemented here
@@ -106,7 +247,7 @@ class machine:
             arg1 = int(text[2])
             result = arg1 << 12                 #note that sign extension does not need special attention in this case
             self.reg[d] = result;
-            self.dump.append([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
+            self.emit([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
             self.PC += 4
         elif (op == "auipc"):
                             #The sole Utype instruction
@@ -114,7 +255,7 @@ class machine:
             arg1 = int(text[2])
             result = (arg1 << 12) + self.PC
             self.reg[d] = result;
-            self.dump.append([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
+            self.emit([(self.PC, self.counter), op, (d, result), (0, 0), (-1, arg1), (-1, -1)])
             self.PC += 4
         elif (op == "ecall" or op == "ebreak"):
                             #We do not have an operating system or system call convention, so they are equivalent of NOP
@@ -122,7 +263,65 @@ class machine:
         else:               #if the op does not fit any in the RV32I instruction set
             raise Exception("Invalid instruction name")
 
-    def run(self):  #this function can be used to repeatedly run the machine until an exception occurs or the instruction is empty
+    def run(self, limit=None):  #this function can be used to repeatedly run the machine until an exception occurs or the instruction is empty.
+        #with a limit, it throws if the program still has instructions to run once the counter reaches limit
+        if (limit is not None):
+            if (self.step(limit - self.counter) and self.fetchable()):
+                raise Exception("Instruction limit of %d reached" % (limit))
+            return
+        decoded = self.decoded
+        end = len(decoded) << 2                 #the first address past the program
+        while (True):
+            pc = self.PC
+            if (pc & 3 or not 0 <= pc < end):   #there is no instruction at misaligned addresses or outside the program, so the run returns
+                return
+            rec = decoded[pc >> 2]
+            if (rec is None):                   #this is implemented as a design choice, we wanted it to stop executing if the line there was empty.
+                return
+            rec[0](self, rec)                   #this may throw, and also the run will throw
+
+    def step(self, count):  #the same as run for at most count instructions. True if it stopped because of the count, so there may be more to run
+        decoded = self.decoded
+        end = len(decoded) << 2
+        while (count > 0):
+            pc = self.PC
+            if (pc & 3 or not 0 <= pc < end):
+                return False
+            rec = decoded[pc >> 2]
+            if (rec is None):
+                return False
+            rec[0](self, rec)
+            count -= 1
+        return True
+
+    def fetchable(self):    #whether run would execute an instruction at PC
+        pc = self.PC
+        return not pc & 3 and 0 <= pc < len(self.decoded) << 2 and self.decoded[pc >> 2] is not None
+
+    def runblocks(self, limit=None):    #the same as run, but executes whole basic blocks compiled by the blocks module per dispatch
+        import blocks                           #imported here as the blocks module needs this one
+        if (self.blocks is None):
+            self.blocks = blocks.blockcache(self)
+        lookup = self.blocks.lookup
+        if (limit is not None):                 #whole blocks while they can not pass the limit, then single instructions
+            while (self.counter + blocks.maxlength <= limit):
+                block = lookup(self.PC)
+                if (block is None):
+                    return
+                block(self)
+            self.run(limit)
+            return
+        while (True):
+            block = lookup(self.PC)
+            if (block is None):                 #no instruction or an empty line at PC, the run returns as in run
+                return
+            block(self)
+
+    def invalidate(self, pc=None):  #to be called if decoded is changed, so that no stale compiled block is run
+        if (self.blocks is not None):
+            self.blocks.invalidate(pc)
+
+    def runtext(self):  #the original interpreter which parses the tokens of every instruction it executes. kept as a reference for the decoded run
         while (True):
             try:
                 inst = self.instmem[self.PC]    #this throws if there is no instruction in that PC and therefore the run returns
@@ -160,7 +359,7 @@ class machine:
             if (res > 11 or res < 0):
                 raise Exception("invalid \"s\" register index")
             if (res < 3):
-                return res + 
+                return res + 8
             else:
                 return res + 16
         elif (text[0] == "t"):#the same logic as s- and a-type naming
@@ -174,30 +373,30 @@ class machine:
         else:   #if any of the formats above are not used where a register name was expected, throw an exception
             raise Exception("Invalid register syntax")
             
-    #functions from here are related to printing status about the emulator 
-    def showdump(self):
-        print("\n\n********DUMP********")
-        for i in self.dump:
+    #functions from here are related to printing status about the emulator. they print to out, a file, or stdout by default
+    def showdump(self, dump=None, out=None):  #prints the dump, or another trace like a tracebuffer (see tracebuf module) given instead
+        print("\n\n********DUMP********", file=out)
+        for i in (self.dump if dump is None else dump):
             res = ""         #printing dump data which traces the whole execution with all ops,arguments and results
             for j in i:
                 res += "%10s" % (str(j))
-            print(res)
+            print(res, file=out)
 
-    def showprogram(self):
-        print("\n\n****INSTRUCTIONS****")
+    def showprogram(self, out=None):
+        print("\n\n****INSTRUCTIONS****", file=out)
         for i in sorted(self.instmem):
             res = "%6s:"%(str(i))
             for j in self.instmem[i]:       #prints the instruction memory tokens in human-readable format. Is a clean version of the input code
                 res += "%6s" % (str(j))
-            print(res)
+            print(res, file=out)
 
-    def showdata(self):
-        print("\n\n********DATA********")   #prints the data memory byte-by-byte, only those locations that were written on. Both hex and decimal
-        for i in sorted(self.datamem.storage):
-            print("%6s:    %s"%(str(i),str(self.datamem.storage[i])))
+    def showdata(self, out=None):
+        print("\n\n********DATA********", file=out)   #prints the data memory byte-by-byte, only those locations that were written on. Both hex and decimal
+        for i, value in self.datamem.items():
+            print("%6s:    %s"%(str(i),str(value)), file=out)
 
-    def showregs(self):
-        print("\n\n******REGISTERS*****")   #shows the register file in decimal and also in hexadecimal
+    def showregs(self, out=None):
+        print("\n\n******REGISTERS*****", file=out)   #shows the register file in decimal and also in hexadecimal
         for i in range(1, 32):
-            print("x%2d:%10d    0x%x" % (i, self.reg[i], self.reg[i]))
+            print("x%2d:%10d    0x%x" % (i, self.reg[i], self.reg[i]), file=out)
 
@@ -0,0 +1,68 @@
+#The same operations as in the ops module, with the same names and bit-identical results, but doing the
+#masking and sign extension with integer arithmetic instead of constructing ctypes objects on every call.
+#The emulator uses this module by default, ops is kept as the reference implementation.
+
+MASK = 0xffffffff
+sext8 = tuple(((i ^ 0x80) - 0x80) for i in range(256))	#sign extension of a byte by table lookup
+
+def opadd(a,b): #for add and addi
+	return (a+b) & MASK
+def opsub(a,b): #for sub and subi
+	return (a-b) & MASK
+def opxor(a,b): #for xor and xori
+	return (a^b) & MASK
+def opor(a,b): #for or and ori
+	return (a|b) & MASK
+def opand(a,b): #for and and andi
+	return (a&b) & MASK
+def opsll(a,b): #for sll and slli
+	return (a<<b) & MASK
+def opsrl(a,b): #for srl and srli
+	return ((a & MASK)>>b) & MASK
+def opsra(a,b): #for sra and srai
+	return (a>>b) & MASK
+def opslt(a,b): #for slt and slti -- flipping the sign bit of two 32-bit values orders them as signed numbers
+	return 1 if ((a & MASK) ^ 0x80000000) < ((b & MASK) ^ 0x80000000) else 0
+def opsltu(a,b): #for sltu and sltui
+	return 1 if (a & MASK) < (b & MASK) else 0
+
+def oplb(mem,idx):#for lb
+	return sext8[mem.get(idx) & 0xff]
+def oplbu(mem,idx):#for lbu
+	return mem.get(idx) & 0xff
+def oplh(mem,idx):#for lh
+	return ((mem.gethalf(idx) & 0xffff) ^ 0x8000) - 0x8000
+def oplhu(mem,idx):#for lhu
+	return mem.gethalf(idx) & 0xffff
+def oplw(mem,idx):#for lw
+	return mem.getword(idx) & MASK
+
+def opsb(mem,idx,data):#for sb
+	mem.write(idx,data)
+	return oplb(mem,idx)
+def opsh(mem,idx,data):#for sh
+	mem.writehalf(idx,data)
+	return oplh(mem,idx)
+def opsw(mem,idx,data):#for sw
+	mem.writeword(idx,data)
+	return oplw(mem,idx)
+
+def opbeq(a,b,immoffset):#for branch if equal
+	return immoffset if a == b else 4
+def opbne(a,b,immoffset):#for branch if not equal
+	return immoffset if a != b else 4
+def opblt(a,b,immoffset):#for branch if less than
+	return immoffset if ((a & MASK) ^ 0x80000000) < ((b & MASK) ^ 0x80000000) else 4
+def opbge(a,b,immoffset):#for branch if greater than or equal to
+	return immoffset if ((a & MASK) ^ 0x80000000) >= ((b & MASK) ^ 0x80000000) else 4
+def opbltu(a,b,immoffset):#for branch if less than (unsigned)
+	return immoffset if (a & MASK) < (b & MASK) else 4
+def opbgeu(a,b,immoffset):#for branch if greater than or equal to (unsigned)
+	return immoffset if (a & MASK) >= (b & MASK) else 4
+
+
+#the operations by kind, for bench.py and the tests
+alus = ["add", "sub", "xor", "or", "and", "sll", "srl", "sra", "slt", "sltu"]
+loads = ["lb", "lbu", "lh", "lhu", "lw"]
+stores = ["sb", "sh", "sw"]
+branches = ["beq", "bne", "blt", "bge", "bltu", "bgeu"]
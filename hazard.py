@@ -1,54 +1,69 @@
+# Lists of types to be used to add stalls
+branchType = ["beq", "bne", "blt", "bge", "bltu", "bgeu", "jal", "jalr"]
+loadType = ["lb", "lh", "lw", "lbu", "lhu"]
 
-def hazardDetector(instructions):
-	# Lists of types to be used to add stalls
-	branchType = ["beq", "bne", "blt", "bge", "bltu", "bgeu", "jal", "jalr"]
-	loadType = ["lb", "lh", "lw", "lbu", "lhu"]
+# The timing model. Trace entries are pushed one at a time (it can be given to emulator.machine as its sink),
+# and each entry gets its (clock, stall) pair once its successor is known. Only the previous and the pending
+# entry are kept, so the memory used does not depend on the length of the program.
+class timer:
+	def __init__(self, sink=None):
+		self.sink = sink	# called with every entry after its timing is written, e.g. to print it
+		self.clock = 4		# the pipeline is filled in 4 cycles
+		self.count = 0
+		self.stalls = 0
+		self.prev = None	# last timed entry, needed for the branch dependency
+		self.pending = None	# entry waiting for the next one, needed for the load-use hazard
 
-	# Initializing counter variables
-	clockCounter = 4
-	instructionCounter = 0
-	
-	print("\n\n*******EXECUTION******")
-	print("arguments and results are as (register,value) with register being -1 for not a register")
-	print("\n%10s%10s%10s%10s%10s%10s"%("PC&order","inst.","result","arg1","arg2","clk&stall"))
-	print("-"*60)
-	
-	# After we get the dump, we can iterate through instructions one by one.
-	for inst in instructions:
+	def push(self, inst):
+		if self.pending is not None:
+			self.time(self.pending, inst)
+		self.pending = inst
+
+	def finish(self):	# times the last entry, which has no successor
+		if self.pending is not None:
+			self.time(self.pending, None)
+			self.pending = None
+		return self.clock
+
+	def time(self, inst, nxt):
+		prev = self.prev
 		# HANDLING CONTROL HAZARDS
 		# If we have a branch type instruction we have two cases.
 		# If this branch instruction is dependent to the destination register of previous instruction we add TWO STALLS,
 		# otherwise we only add ONE STALL.
+		# The first entry has no previous one, so it has no dependency (the old loop compared it with the last entry).
 		if inst[1] in branchType:
-			if not instructions[instructionCounter - 1][1] in branchType and (
-                    	(inst[3][0] == instructions[instructionCounter - 1][2][0] and
-                     	inst[3][0] != 0 and inst[3][0] != -1) or
-                    	(inst[4][0] == instructions[instructionCounter - 1][2][0] and
-                     	inst[4][0] != 0 and inst[4][0] != -1)):
-				clockCounter += 3
-				inst[5] = (clockCounter, 2)
+			if prev is not None and not prev[1] in branchType and (
+					(inst[3][0] == prev[2][0] and inst[3][0] != 0 and inst[3][0] != -1) or
+					(inst[4][0] == prev[2][0] and inst[4][0] != 0 and inst[4][0] != -1)):
+				stall = 2
 			else:
-				clockCounter += 2
-				inst[5] = (clockCounter, 1)
-
+				stall = 1
 		# HANDLING DATA HAZARDS
 		# If we have a load type instruction, and also if next instruction needs to use the register that is supposed to
 		# change in this load instruction we add ONE STALL.
+		# The last entry has no next one, so a load there has no stall (the old loop raised IndexError).
 		elif inst[1] in loadType:
-			if inst[2][0] == instructions[instructionCounter + 1][3][0] or \
-					inst[2][0] == instructions[instructionCounter + 1][4][0]:
-				clockCounter += 2
-				inst[5] = (clockCounter, 1)
+			if nxt is not None and (inst[2][0] == nxt[3][0] or inst[2][0] == nxt[4][0]):
+				stall = 1
 			else:
-				clockCounter += 1
-				inst[5] = (clockCounter, 0)
+				stall = 0
 		#  If there is no hazard we just add one cycle and continue with our instructions. The number of stalls will be 0.
 		else:
-			clockCounter += 1
-			inst[5] = (clockCounter, 0)
-		instructionCounter += 1
-		res = ""
-		for j in inst:
-			res += "%10s" % (str(j))
-		print(res)
-	return 0
+			stall = 0
+		self.clock += 1 + stall
+		self.stalls += stall
+		self.count += 1
+		inst[5] = (self.clock, stall)
+		self.prev = inst
+		if self.sink is not None:
+			self.sink(inst)
+
+
+def hazardDetector(instructions, sink=None):	# times a whole trace, sink (e.g. a reporter writer's row) gets every timed entry
+	# After we get the dump, we can iterate through instructions one by one.
+	timing = timer(sink)
+	for inst in instructions:
+		timing.push(inst)
+	timing.finish()
+	return timing
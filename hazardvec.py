@@ -0,0 +1,56 @@
+import numpy as np  #this module is only for post-run analysis, the emulator and hazard do not need numpy
+import hazard
+import tracebuf
+
+# The same timing model as hazard.timer, computed for a whole trace at once with array operations.
+# It works on the columns of a tracebuf.tracebuffer, comparing every entry with its neighbours by shifting the columns.
+
+dtypes = {"q": np.int64, "b": np.int8, "B": np.uint8}
+
+class vectortiming:	# the totals, with the same names as in hazard.timer so the totals of the reporter writers can print them
+	def __init__(self, clocks, stalls):
+		self.clocks = clocks
+		self.stallcol = stalls
+		self.count = len(clocks)
+		self.clock = int(clocks[-1]) if len(clocks) else 4
+		self.stalls = int(stalls.sum())
+
+def column(trace, name):	# a numpy view of a trace column, writes to it go into the trace
+	return np.frombuffer(getattr(trace, name), dtype=dtypes[dict(tracebuf.columns)[name]])
+
+def timeTrace(trace):	# writes the clock and stall columns of the trace and returns the totals
+	if isinstance(trace, list):
+		dump, trace = trace, tracebuf.tracebuffer()
+		for inst in dump:
+			trace.append(inst)
+	ops = column(trace, "op")
+	rd = column(trace, "rd")
+	rs1 = column(trace, "rs1")
+	rs2 = column(trace, "rs2")
+	count = len(ops)
+	stalls = np.zeros(count, dtype=np.int64)
+	if count:
+		isBranch = np.array([op in hazard.branchType for op in trace.opcodes], dtype=bool)[ops]
+		isLoad = np.array([op in hazard.loadType for op in trace.opcodes], dtype=bool)[ops]
+
+		# HANDLING CONTROL HAZARDS
+		# a branch depends on the previous instruction if one of its source registers (other than x0 or an
+		# immediate) is the destination of that instruction, and that instruction is not a branch itself
+		prevRd = rd[:-1]
+		dep1 = (rs1[1:] == prevRd) & (rs1[1:] != 0) & (rs1[1:] != -1)
+		dep2 = (rs2[1:] == prevRd) & (rs2[1:] != 0) & (rs2[1:] != -1)
+		dependent = np.zeros(count, dtype=bool)
+		dependent[1:] = ~isBranch[:-1] & (dep1 | dep2)
+		stalls[isBranch] = 1
+		stalls[isBranch & dependent] = 2
+
+		# HANDLING DATA HAZARDS
+		# a load stalls once if the next instruction reads its destination register
+		used = np.zeros(count, dtype=bool)
+		used[:-1] = (rd[:-1] == rs1[1:]) | (rd[:-1] == rs2[1:])
+		stalls[isLoad & used] = 1
+
+	clocks = 4 + np.cumsum(stalls + 1)
+	column(trace, "clock")[:] = clocks
+	column(trace, "stall")[:] = stalls
+	return vectortiming(clocks, stalls)
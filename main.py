@@ -1,30 +1,181 @@
-import sys      #to get the input file name as the command line argument
-import emulator #the RISC-V emulator
-import hazard   #the module to calculate the timing of the instructions
-
-
-if(len(sys.argv)!=2): #check for the correct use of the application and print usage instructions if incorrect
-	print("usage:\"python[3] main.py <inputFileName>\"")
-	print("input file shoud have RISC-V instructions (without pseudoinstructions, labels and empty lines)")
-	sys.exit(-1)
-
-#create an emulator object with instructions in the file given as a command line argument
-mymac = emulator.machine(sys.argv[1])
-try:
-    mymac.run()
-except Exception as e: #if the run returns by throwing, then print bug warning but do the rest of the tallying so the user can trace the bug 
-    print("!!!!!!!!!!BUG!!!!!!!!!!!") 
-    print(e)
-    print("I will dump stuff up to here anyway:")
-
-mymac.showprogram()		#first print the human-readable tokens fetched into the instruction memory of the machine
-mymac.showdata()		#then print the data memory of the machine on a byte basis
-mymac.showregs()		#then show the content of the 32 registers
-#mymac.showdump()		#then maybe show the emulator trace or...
-hazard.hazardDetector(mymac.dump)#call the timing simulator which writes timing data into the program trace dump and prints it beautifully
-
-#finally, calculate and print the necessary statistics about the execution
-print("\n\n**CLOCKS AND STALLS**")
-print("Number of instructions executed: ", len(mymac.dump))
-print("Number of clock cycles: ", mymac.dump[-1][5][0])
-print("Number of stalls added: ", mymac.dump[-1][5][0] - len(mymac.dump) -4)
+import sys      #to exit with an error code
+import argparse #to get the input file name and the options as command line arguments
+import emulator #the RISC-V emulator
+import hazard   #the module to calculate the timing of the instructions
+import tracebuf #compact binary traces that can be saved and analyzed later
+import reporter #the output formats
+import mem      #for the choice of data memory implementation
+import ops      #and of the op implementations
+import fastops
+import checkpoint #snapshots of the machine to resume a run from
+import profiler #where the cycles and stalls of the program go
+import online   #the pipeline timing the instructions while they run
+import dcache   #the data cache whose misses are added to the timing
+
+
+#check for the correct use of the application and print usage instructions if incorrect
+parser = argparse.ArgumentParser(usage="python[3] main.py [options] <inputFileName> | --analyze DIR [--vector]",
+	description="input file shoud have RISC-V instructions (without pseudoinstructions, labels and empty lines), or be .s assembly with labels and comments, or a .bin image (see assembler module)")
+parser.add_argument("inputFileName", nargs="?")
+parser.add_argument("--stream", action="store_true",
+	help="time and print every instruction while emulating instead of keeping the whole trace (constant memory)")
+parser.add_argument("--online", action="store_true",
+	help="like --stream, but timed by a cycle by cycle pipeline model running with the emulator (see online module)")
+parser.add_argument("--budget", metavar="CYCLES", type=int,
+	help="with --online, stop the run once it has taken this many cycles")
+parser.add_argument("--limit", metavar="N", type=int,
+	help="stop a runaway program with an error after N instructions (the cycle version is --online --budget)")
+parser.add_argument("--progress", metavar="CYCLES", type=int,
+	help="with --online, print the instructions, stalls and CPI so far to stderr every so many cycles")
+parser.add_argument("--trace", metavar="DIR",
+	help="also save the timed trace to DIR in compact binary form (see tracebuf module)")
+parser.add_argument("--analyze", metavar="DIR",
+	help="time and print a trace saved with --trace instead of emulating a program again")
+parser.add_argument("--vector", action="store_true",
+	help="with --analyze, time the whole trace at once with numpy (see hazardvec module)")
+parser.add_argument("--blocks", action="store_true",
+	help="run with the block engine, which compiles and caches basic blocks (see blocks module)")
+parser.add_argument("--memory", choices=sorted(mem.memories),
+	help="data memory implementation: a dictionary entry per byte (the default), or 4 KiB pages allocated on first write (the default with --checkpoint and --resume)")
+parser.add_argument("--alu", choices=["ctypes", "fast"], default="fast",
+	help="op implementations: the ctypes reference (ops module) or the integer masking ones (fastops module)")
+parser.add_argument("--cache", metavar="DIR",
+	help="keep the decoded program in DIR, keyed by the hash of the file, so running it again skips reading and decoding")
+parser.add_argument("--checkpoint", metavar="N", type=int,
+	help="save the machine state every N instructions, so a long or failing run can be resumed (see checkpoint module)")
+parser.add_argument("--checkpoint-file", metavar="FILE", default="machine.rvck",
+	help="where --checkpoint saves the state, machine.rvck by default")
+parser.add_argument("--resume", metavar="FILE",
+	help="start from a state saved with --checkpoint instead of PC 0. the trace and timing only cover the resumed part")
+parser.add_argument("--profile", metavar="N", type=int, nargs="?", const=10,
+	help="after the totals, list the N (10 by default) instructions and blocks with the most cycles and stalls (see profiler module)")
+parser.add_argument("--dcache", metavar="SPEC", nargs="?", const="",
+	help="add the misses of a data cache to the timing, SPEC like size=4096,ways=2,line=32,policy=lru,write=back,penalty=20 (see dcache module)")
+parser.add_argument("--output", choices=sorted(reporter.writers), default="table",
+	help="table: everything as before, summary: only the clocks and stalls, csv/jsonl: one record per instruction")
+parser.add_argument("--out", metavar="FILE", help="write the output to FILE instead of stdout")
+args = parser.parse_args()
+if(args.inputFileName is None and args.analyze is None):
+	parser.error("an input file or --analyze is needed")
+if((args.budget is not None or args.progress is not None) and not args.online):
+	parser.error("--budget and --progress need --online")
+if(args.online):
+	args.stream = True	#the online pipeline is a streaming timing model
+if(args.budget is not None and (args.blocks or args.checkpoint is not None or args.limit is not None)):
+	parser.error("--budget can not be used with --blocks, --checkpoint or --limit")
+if(args.checkpoint is not None and args.blocks):
+	parser.error("--checkpoint runs instruction by instruction and can not be used with --blocks")
+if(args.checkpoint is not None and args.memory == "dict"):
+	parser.error("--checkpoint only saves the pages written since the last checkpoint, which needs --memory paged")
+if(args.memory is None):
+	args.memory = "paged" if args.checkpoint is not None or args.resume is not None else "dict"
+
+out = reporter.openoutput(args.out)	#everything is written through this single buffered file
+writer = reporter.writers[args.output](out)
+row = None if args.output == "summary" else writer.row	#no need to visit the entries if nothing is printed for them
+prof = None
+if(args.profile is not None):
+	prof = profiler.profile(row)	#counts every timed entry, then hands it on to the writer
+	row = prof.push
+cached = None
+if(args.dcache is not None):
+	try:
+		cached = dcache.cachedtiming(dcache.parse(args.dcache), row)	#delays the timed entries by the cache misses before the profile and writer see them
+	except Exception as e:
+		parser.error("bad --dcache: %s" % (str(e)))
+	row = cached.push
+
+if(args.analyze is not None):
+	#the saved trace is memory-mapped and timed without running the emulator
+	trace = tracebuf.tracebuffer.load(args.analyze)
+	writer.header()
+	if(args.vector):
+		import hazardvec	#needs numpy, so it is only imported here
+		timing = hazardvec.timeTrace(trace)
+		if(row is not None):
+			for inst in trace:
+				row(inst)
+	else:
+		timing = hazard.hazardDetector(trace, row)
+	if(cached is not None):
+		cached.timing = timing
+		timing = cached
+	writer.totals(timing)
+	if(cached is not None):
+		cached.cache.report(out)
+	if(prof is not None):
+		prof.report(top=args.profile, out=out)	#a saved trace has no program text
+	out.close()
+	sys.exit(0)
+
+alu = ops if args.alu == "ctypes" else fastops
+saved = None if args.trace is None else tracebuf.tracebuffer(spill=args.trace)
+if(args.stream):
+	#the timing model consumes the trace while the machine runs, so the dump is never built
+	sink = row
+	if(saved is not None):
+		if(row is None):
+			sink = saved.append
+		else:
+			def sink(inst):
+				row(inst)
+				saved.append(inst)
+	if(args.online):
+		timing = online.pipeline(sink, args.budget, args.progress, online.printprogress if args.progress else None)
+	else:
+		timing = hazard.timer(sink)
+	mymac = emulator.machine(args.inputFileName, sink=timing.push, memory=mem.memories[args.memory], alu=alu, cache=args.cache)
+	if(writer.state):
+		mymac.showprogram(out)	#the program is known before running, so it is printed first
+	writer.header()			#rows of the execution table are printed as they are timed
+else:
+	#create an emulator object with instructions in the file given as a command line argument
+	mymac = emulator.machine(args.inputFileName, memory=mem.memories[args.memory], alu=alu, cache=args.cache)
+if(args.resume is not None):
+	try:
+		checkpoint.restore(mymac, checkpoint.load(args.resume))
+	except Exception as e:	#a missing file, another program or another --memory
+		parser.error("can not resume from %s: %s" % (args.resume, str(e)))
+stopped = False
+try:
+    if(args.budget is not None):
+        stopped = online.runbudget(mymac, timing)
+    elif(args.checkpoint is not None):
+        checkpoint.runcheckpointed(mymac, args.checkpoint, args.checkpoint_file, args.limit)
+    elif(args.blocks):
+        mymac.runblocks(args.limit)
+    else:
+        mymac.run(args.limit)
+except Exception as e: #if the run returns by throwing, then print bug warning but do the rest of the tallying so the user can trace the bug
+    writer.bug(e)
+
+if(args.stream):
+	timing.finish()		#time the last instruction, which had no successor to wait for
+if(stopped):
+	sys.stderr.write("stopped at the budget of %d cycles, PC %d\n" % (args.budget, mymac.PC))
+if(writer.state):
+	if(not args.stream):
+		mymac.showprogram(out)	#first print the human-readable tokens fetched into the instruction memory of the machine
+	mymac.showdata(out)		#then print the data memory of the machine on a byte basis
+	mymac.showregs(out)		#then show the content of the 32 registers
+	#mymac.showdump(out=out)	#then maybe show the emulator trace or...
+if(not args.stream):
+	writer.header()
+	timing = hazard.hazardDetector(mymac.dump, row)#call the timing simulator which writes timing data into the program trace dump, the writer prints it
+
+if(saved is not None):
+	if(not args.stream):
+		for inst in mymac.dump:
+			saved.append(inst)
+	saved.close()
+
+#finally, calculate and print the necessary statistics about the execution
+if(cached is not None):
+	cached.timing = timing
+	timing = cached
+writer.totals(timing)
+if(cached is not None):
+	cached.cache.report(out)
+if(prof is not None):
+	prof.report(mymac.instmem, args.profile, out)
+out.close()
@@ -1,21 +1,19 @@
-import ctypes	#to be used for getting last 8 bits of some data in an unsigned manner
+import sys	#to check the byte order for the page views of pagedmemory
+from array import array
 
 class regfile: #the register file class to be used in the emulator
+	__slots__=("storage",)
 	def __init__(self):
-		self.storage=[0 for i in range(32)]	#the data is stored as python integers in a list
+		self.storage=[0 for i in range(32)]	#the data is stored as python integers in a list. storage[0] is always 0
 	def __getitem__(self,key):			#python [] indexing is enabled for convenience 
-		if(key==0):				#registers are indexed with numbers and index 0 always returns a 0
-			return 0
-		else:
-			return self.storage[key]	#simply return data from the array
+		return self.storage[key]		#register 0 is never left non-zero, so it reads as 0 without a check
 	def __setitem__(self,key,value):		#[] operator is again enabled
-		if(key==0):
-			return				#no action is done for register 0
-		else:
-			self.storage[key]=value		#otherwise write into the register wanted
+		self.storage[key]=value			#write, then put register 0 back to 0 in case it was the one written.
+		self.storage[0]=0			#cheaper than a branch on every write. the handlers of emulator do the same on storage
 
 
 class datamemory: #the class for data memory to be used in the emulator
+	__slots__=("storage",)
 	def __init__(self):
 		self.storage=dict()	#all the data is held in a dictionary to avoid gigabytes-sized memory usage
 
@@ -37,7 +35,7 @@ class datamemory: #the class for data memory to be used in the emulator
 		else: #little endian
 			return self.get(index)+(self.get(index+1)<<8)
 	def write(self,index,data):				#writing a single byte into the memory. Again this is the only way to access the container
-		self.storage[index]=ctypes.c_uint8(data).value	#this is done to get rid of the sign and get the least significant 8 bits
+		self.storage[index]=data & 0xff	#this is done to get rid of the sign and get the least significant 8 bits
 	def writehalf(self,index,data):
 		if(index%2!=0):					#see getword for the explanation
 			raise Exception("Misaligned memory write address for half!")
@@ -54,3 +52,116 @@ class datamemory: #the class for data memory to be used in the emulator
 			self.write(index+1,data>>8)
 			self.write(index+2,data>>16)
 			self.write(index+3,data>>24)
+
+	def items(self):		#(address, byte) for every byte written, in address order
+		return sorted(self.storage.items())
+
+	def snapshot(self):		#the state for restore. the bytes are python ints, so a shallow copy is enough
+		return dict(self.storage)
+	def restore(self,state):
+		self.storage=dict(state)
+
+
+class pagedmemory: #the same data memory, kept in 4 KiB pages allocated on first write instead of a dictionary entry per byte
+	__slots__=("pages","words","halves","written","own","native")
+	def __init__(self):
+		self.pages=dict()	#page number -> bytearray of its 4096 bytes
+		self.words=dict()	#page number -> the same page viewed as 32-bit words, see getword
+		self.halves=dict()	#page number -> the same page viewed as 16-bit half words
+		self.written=dict()	#page number -> bytearray with a 1 for every byte ever written, so items (and showdata) list the same locations as datamemory
+		self.own=dict()		#page number -> (page, words, halves, written) for the pages this memory may write. pages shared with a snapshot are copied first
+		self.native=sys.byteorder=="little" and array("I").itemsize==4	#the views are only usable if they are little endian 32 and 16 bits
+
+	def acquire(self,number):	#makes the page writable: allocates it on its first write, or copies it if a snapshot shares it
+		old=self.pages.get(number)
+		data=bytearray(4096) if old is None else bytearray(old)
+		written=bytearray(4096) if old is None else bytearray(self.written[number])
+		self.pages[number]=data
+		self.written[number]=written
+		words=halves=None
+		if self.native:
+			view=memoryview(data)
+			words=self.words[number]=view.cast("I")
+			halves=self.halves[number]=view.cast("H")
+		own=self.own[number]=(data,words,halves,written)
+		return own
+
+	def get(self,index):		#read a byte, 0 if nothing was written there #DOES NOT SIGN EXTEND
+		data=self.pages.get(index>>12)
+		if data is None:
+			return 0
+		return data[index&4095]
+	def getword(self,index):	#aligned words never cross pages, so a word is a single read from the page
+		if(index%4!=0):
+			raise Exception("Misaligned memory read address for word!")
+		if self.native:
+			words=self.words.get(index>>12)
+			return 0 if words is None else words[(index&4095)>>2]
+		data=self.pages.get(index>>12)
+		return 0 if data is None else int.from_bytes(data[index&4095:(index&4095)+4],"little")
+	def gethalf(self,index):	#DOES NOT SIGN EXTEND
+		if(index%2!=0):
+			raise Exception("Misaligned memory read address for half!")
+		if self.native:
+			halves=self.halves.get(index>>12)
+			return 0 if halves is None else halves[(index&4095)>>1]
+		data=self.pages.get(index>>12)
+		return 0 if data is None else int.from_bytes(data[index&4095:(index&4095)+2],"little")
+	def write(self,index,data):
+		own=self.own.get(index>>12) or self.acquire(index>>12)
+		own[0][index&4095]=data&255	#the least significant 8 bits, as in datamemory.write
+		own[3][index&4095]=1
+	def writehalf(self,index,data):
+		if(index%2!=0):
+			raise Exception("Misaligned memory write address for half!")
+		own=self.own.get(index>>12) or self.acquire(index>>12)
+		offset=index&4095
+		if self.native:
+			own[2][offset>>1]=data&0xffff
+		else:
+			own[0][offset:offset+2]=(data&0xffff).to_bytes(2,"little")
+		own[3][offset:offset+2]=b"\x01\x01"
+	def writeword(self,index,data):
+		if(index%4!=0):
+			raise Exception("Misaligned memory write address for word!")
+		own=self.own.get(index>>12) or self.acquire(index>>12)
+		offset=index&4095
+		if self.native:
+			own[1][offset>>2]=data&0xffffffff
+		else:
+			own[0][offset:offset+4]=(data&0xffffffff).to_bytes(4,"little")
+		own[3][offset:offset+4]=b"\x01\x01\x01\x01"
+
+	def items(self):		#(address, byte) for every byte written, in address order
+		res=[]
+		for number in sorted(self.pages):
+			data=self.pages[number]
+			written=self.written[number]
+			base=number<<12
+			offset=written.find(1)
+			while offset!=-1:
+				res.append((base+offset,data[offset]))
+				offset=written.find(1,offset+1)
+		return res
+
+	def changed(self):		#the numbers of the pages written since the last snapshot or restore, the only ones this memory owns
+		return sorted(self.own)
+
+	def snapshot(self):		#the state for restore. the pages are shared with it, not copied, until this memory writes them again
+		self.own.clear()
+		return (dict(self.pages),dict(self.written))
+	def restore(self,state):
+		pages,written=state
+		self.pages=dict(pages)
+		self.written=dict(written)
+		self.own=dict()
+		self.words=dict()
+		self.halves=dict()
+		if self.native:
+			for number,data in self.pages.items():
+				view=memoryview(data)
+				self.words[number]=view.cast("I")
+				self.halves[number]=view.cast("H")
+
+
+memories={"dict":datamemory,"paged":pagedmemory}	#the data memory implementations a machine can be built with
@@ -0,0 +1,126 @@
+import sys
+import argparse
+from collections import deque
+import emulator
+import hazard
+
+# Timing while the machine runs. A pipeline takes the trace entries one by one as the sink of emulator.machine and
+# moves them through IF/ID/EX/MEM/WB latches a cycle at a time, so the clock, the stalls and the CPI are known at
+# every point of the run, a run can be stopped when it has used a cycle budget, and nothing but the five latches
+# and the entry before the newest one is kept.
+# Hazards are resolved by holding the fetch: the stalls of an instruction are bubbles entering IF before its
+# successor is fetched, with the same rules as hazard.timer (one bubble after every branch, two if it needs the
+# result of the instruction before it, and one after a load whose result the next instruction reads). A load's
+# bubble is known when its successor arrives, which is also when the fetch it delays happens, so no lookahead is
+# needed. The totals and the (clock, stall) written into every entry are those of hazard.
+
+stages = ("IF", "ID", "EX", "MEM", "WB")
+
+class pipeline:
+	def __init__(self, sink=None, budget=None, every=None, progress=None):
+		self.sink = sink		# called with every entry after its timing is written, as for hazard.timer
+		self.latches = deque([None] * len(stages), maxlen=len(stages))	# IF first, None for a bubble
+		self.cycle = 0			# cycles simulated so far
+		self.count = 0			# instructions fetched
+		self.retired = 0		# instructions that left WB
+		self.stalls = 0
+		self.prev = None		# the newest entry, which waits for its successor to know its stall
+		self.branchstall = 0		# bubbles the newest entry causes if it is a branch
+		self.budget = budget		# cycles after which stopped is set, None for no limit
+		self.stopped = False
+		self.drained = False
+		self.every = every		# progress is called with the pipeline every so many cycles
+		self.progress = progress
+		self.report = every
+
+	@property
+	def clock(self):	# the clock count if the run ended now: the cycles so far and the drain of the last instruction
+		return self.cycle if self.drained else self.cycle + len(stages) - 1
+
+	def tick(self, fetched):	# one cycle: every latch moves one stage on, fetched (or a bubble) enters IF
+		if self.latches[-1] is not None:
+			self.retired += 1
+		self.latches.appendleft(fetched)
+		self.cycle += 1
+		if self.budget is not None and self.cycle >= self.budget:
+			self.stopped = True
+		if self.report is not None and self.cycle >= self.report:
+			self.report += self.every
+			self.progress(self)
+
+	def push(self, inst):
+		if self.prev is not None:
+			prev = self.prev
+			stall = self.branchstall
+			if prev[1] in hazard.loadType and (prev[2][0] == inst[3][0] or prev[2][0] == inst[4][0]):
+				stall = 1	# load-use: inst would read the loaded register one cycle too early
+			self.retire(prev, stall)
+		self.branchstall = 0
+		if inst[1] in hazard.branchType:	# resolved in ID, or in EX if it needs the result of the instruction before it
+			before = self.prev
+			self.branchstall = 2 if before is not None and not before[1] in hazard.branchType and (
+				(inst[3][0] == before[2][0] and inst[3][0] != 0 and inst[3][0] != -1) or
+				(inst[4][0] == before[2][0] and inst[4][0] != 0 and inst[4][0] != -1)) else 1
+		self.prev = inst
+		self.count += 1
+		self.tick(inst)
+
+	def retire(self, inst, stall):	# inserts the bubbles of inst and writes its timing, as hazard.timer.time does
+		for i in range(stall):
+			self.tick(None)
+		self.stalls += stall
+		inst[5] = (self.cycle + len(stages) - 1, stall)
+		if self.sink is not None:
+			self.sink(inst)
+
+	def finish(self):	# the last instruction has no successor, its bubbles are added and the pipeline drained
+		if self.prev is not None:
+			self.retire(self.prev, self.branchstall)
+			self.prev = None
+			self.branchstall = 0
+		if not self.drained:
+			for i in range(len(stages) - 1):	# like the 4 cycles hazard starts with, also for an empty run
+				self.tick(None)
+			self.drained = True
+		return self.clock
+
+	def cpi(self):
+		return self.clock / self.count if self.count else 0.0
+
+	def show(self, out=sys.stdout):		# the op in every latch, "-" for a bubble
+		out.write("cycle %d: %s\n" % (self.cycle, "  ".join("%s %s" % (name, "-" if inst is None else inst[1]) for name, inst in zip(stages, self.latches))))
+
+
+def runbudget(mac, pipe):	# runs until the program ends or the pipeline reaches its budget. True if the budget stopped it.
+	# an instruction takes at most 4 cycles (itself and 3 bubbles), so stepping a quarter of the cycles left never
+	# goes more than 3 cycles past the budget
+	while not pipe.stopped:
+		if not mac.step(max(1, (pipe.budget - pipe.cycle) // 4)):
+			return False
+	return True
+
+def printprogress(pipe, out=sys.stderr):
+	out.write("cycle %d: %d instructions, %d stalls, CPI %.3f\n" % (pipe.cycle, pipe.count, pipe.stalls, pipe.cpi()))
+	out.flush()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="time a program cycle by cycle while it runs")
+	parser.add_argument("inputFileName", help="program to emulate")
+	parser.add_argument("--budget", type=int, metavar="CYCLES", help="stop the run after this many cycles")
+	parser.add_argument("--progress", type=int, metavar="CYCLES", help="print the totals so far every so many cycles")
+	parser.add_argument("--latches", action="store_true", help="print the latches at every cycle (for short programs)")
+	args = parser.parse_args()
+	every, progress = (args.progress, printprogress) if args.progress else (None, None)
+	if args.latches:
+		every, progress = 1, lambda pipe: pipe.show()
+	pipe = pipeline(budget=args.budget, every=every, progress=progress)
+	mac = emulator.machine(args.inputFileName, sink=pipe.push)
+	try:
+		stopped = runbudget(mac, pipe) if args.budget is not None else mac.run()
+	except Exception as e:
+		print("!!!!!!!!!!BUG!!!!!!!!!!!\n%s" % (str(e)))
+		stopped = False
+	pipe.finish()
+	if stopped:
+		print("stopped at the budget of %d cycles, PC %d" % (args.budget, mac.PC))
+	printprogress(pipe, sys.stdout)
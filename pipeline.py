@@ -0,0 +1,171 @@
+import sys
+import argparse
+import itertools
+import emulator
+import hazard
+import tracebuf
+
+# A parametrized version of the timing model in hazard. Instead of counting fixed stalls, every instruction gets the
+# cycle it is in the EX stage, as early as its operands and the instruction before it allow:
+#	- a value is ready at the end of the stage that produces it: EX for ALU results, EX + load latency for loads,
+#	  ID for the link register of jal/jalr, or the stage before WB for everything when there is no forwarding
+#	  (the register file is written in the first half of a cycle and read in the second)
+#	- a consumer needs its operands at the start of EX, or of the branch resolution stage for branches, or of ID
+#	  when there is no forwarding
+#	- the instruction after a branch or jump is fetched after the branch is resolved, unless a predictor guessed
+#	  the (conditional) branch right
+# so a consumer at EX cycle e depending on a producer at EX cycle p needs e >= p + ready - needed + 1.
+# Stages are numbered IF=1, ID=2, EX=3, MEM=4, and WB is the last one (depth).
+# Like hazard.timer, a model writes (clock, stall) into every entry once its successor is known and hands it to its sink,
+# and has the totals as count, clock and stalls. The bubbles before an instruction are stalls of the one waiting for an
+# operand, except that the load latency bubbles go to the load, and the bubbles after a branch are stalls of the branch,
+# which is how hazard counts them.
+
+conditionals = ["beq", "bne", "blt", "bge", "bltu", "bgeu"]
+jumps = ["jal", "jalr"]
+
+class pipelinemodel:
+	def __init__(self, depth=5, branchstage=2, forwarding=True, loadlatency=1, predictor=None, window=None, exstage=3, sink=None):
+		if not 2 <= branchstage < depth or not 2 <= exstage < depth:
+			raise Exception("Branches and EX have to be between ID and WB!")
+		if predictor not in predictors:
+			raise Exception("Unknown branch predictor!")
+		self.depth = depth
+		self.branchstage = branchstage
+		self.forwarding = forwarding
+		self.loadlatency = loadlatency
+		self.predictor = predictor	# None (stall for every branch), "nottaken", "1bit" or "2bit"
+		self.window = window		# how many instructions back dependencies are checked, None for all in flight
+		self.exstage = exstage
+		self.ready = dict()		# register -> (cycle its value can be used by a consumer, index of the producer)
+		self.table = dict()		# branch PC -> predictor state
+		self.sink = sink		# called with every entry after its timing is written, as for hazard.timer
+		self.count = 0
+		self.clock = depth - 1		# the clock of the last timed entry, the pipeline is filled in depth - 1 cycles
+		self.stalls = 0
+		self.pending = None		# the newest entry, which waits for its successor to know its stall
+		self.owed = 0			# stalls of the newest entry from waiting for its operands
+		self.ex = -1			# EX cycle of the last instruction
+		self.earliest = 0		# EX cycle the next instruction can have, after a branch penalty
+		self.branches = 0
+		self.mispredicts = 0
+
+	def name(self):
+		return "d%d/b%d/%s/l%d/%s%s" % (self.depth, self.branchstage, "fw" if self.forwarding else "nofw", self.loadlatency,
+			self.predictor or "stall", "" if self.window is None else "/w%d" % (self.window))
+
+	def push(self, inst):	# takes one trace entry, can be given to emulator.machine as its sink
+		op = inst[1]
+		if op in conditionals or op in jumps:
+			needed = self.branchstage if self.forwarding else 2
+		else:
+			needed = self.exstage if self.forwarding else 2
+		start = max(self.ex + 1, self.earliest)	# without waiting for operands
+		ex = start
+		for src in (inst[3][0], inst[4][0]):
+			if src > 0 and src in self.ready:
+				cycle, index = self.ready[src]
+				if self.window is None or self.count - index <= self.window:
+					ex = max(ex, cycle - needed + 1)
+		dest = inst[2][0]
+		if dest > 0:
+			if not self.forwarding:
+				ready = self.depth - 1
+			elif op in jumps:
+				ready = 2
+			elif op in hazard.loadType:
+				ready = self.exstage + self.loadlatency
+			else:
+				ready = self.exstage
+			self.ready[dest] = (ex + ready, self.count)	# kept relative to stage numbers, see the inequality at the top
+		self.earliest = 0
+		if op in jumps or op in conditionals:
+			self.branches += 1
+			if op in conditionals and self.predictor is not None and self.predict(inst[0][0], inst[2][1] != 4):
+				pass	# guessed right, fetching continued on the right path
+			else:
+				if op in conditionals and self.predictor is not None:
+					self.mispredicts += 1
+				self.earliest = ex + self.branchstage	# fetched the cycle after resolution, so branchstage - 1 bubbles
+		wait = ex - start
+		if self.pending is not None:
+			penalty = start - self.ex - 1		# bubbles after a branch
+			charged = min(wait, self.loadlatency) if self.pending[1] in hazard.loadType and self.pending[2][0] in (inst[3][0], inst[4][0]) else 0
+			self.retire(self.pending, self.owed + penalty + charged)
+			wait -= charged
+		self.pending = inst
+		self.owed = wait
+		self.ex = ex
+		self.count += 1
+
+	def predict(self, pc, taken):	# whether the predictor guessed this outcome, and its update
+		if self.predictor == "nottaken":
+			return not taken
+		state = self.table.get(pc, 1 if self.predictor == "2bit" else 0)
+		if self.predictor == "1bit":
+			self.table[pc] = 1 if taken else 0
+			return (state == 1) == taken
+		self.table[pc] = min(state + 1, 3) if taken else max(state - 1, 0)	# 2bit saturating counter, taken from 2 up
+		return (state >= 2) == taken
+
+	def retire(self, inst, stall):
+		self.clock += 1 + stall
+		self.stalls += stall
+		inst[5] = (self.clock, stall)
+		if self.sink is not None:
+			self.sink(inst)
+
+	def finish(self):	# the last instruction leaves WB depth - exstage cycles after its EX, which is at cycle exstage for the first.
+		# a trailing branch still costs its bubbles, the fetch of its target is part of the run as in hazard
+		if self.pending is not None:
+			self.retire(self.pending, max(self.ex, self.earliest - 1) + self.depth - self.clock - 1)
+			self.pending = None
+		return self.clock
+
+
+predictors = (None, "nottaken", "1bit", "2bit")
+
+def legacy(sink=None):	# the configuration of hazard.timer: 5 stages, branches resolved in ID, only neighbour dependencies
+	return pipelinemodel(window=1, sink=sink)
+
+def evaluate(trace, models):	# times one trace on every model in a single pass over it, the entries keep the timing of the last model
+	for inst in trace:
+		for model in models:
+			model.push(inst)
+	for model in models:
+		model.finish()
+	return models
+
+def sweep(depths=(5,), branchstages=(2,), forwardings=(True,), loadlatencies=(1,), predictors=(None,)):
+	return [pipelinemodel(d, b, f, l, p) for d, b, f, l, p in itertools.product(depths, branchstages, forwardings, loadlatencies, predictors)]
+
+def printmodels(models, out=sys.stdout):
+	out.write("%-28s%14s%14s%12s%8s%10s%12s\n" % ("model", "instructions", "cycles", "stalls", "CPI", "branches", "mispredicts"))
+	for m in models:
+		out.write("%-28s%14d%14d%12d%8.3f%10d%12d\n" % (m.name(), m.count, m.clock, m.stalls,
+			m.clock / m.count if m.count else 0.0, m.branches, m.mispredicts))
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="time one trace on several pipeline configurations")
+	parser.add_argument("inputFileName", nargs="?", help="program to emulate")
+	parser.add_argument("--analyze", metavar="DIR", help="use a trace saved with main.py --trace instead of a program")
+	parser.add_argument("--depth", type=int, nargs="+", default=[5])
+	parser.add_argument("--branchstage", type=int, nargs="+", default=[2], help="2 for ID, 3 for EX...")
+	parser.add_argument("--forwarding", choices=["on", "off"], nargs="+", default=["on"])
+	parser.add_argument("--loadlatency", type=int, nargs="+", default=[1])
+	parser.add_argument("--predictor", choices=["stall", "nottaken", "1bit", "2bit"], nargs="+", default=["stall"])
+	args = parser.parse_args()
+	if args.analyze is not None:
+		trace = tracebuf.tracebuffer.load(args.analyze)
+	elif args.inputFileName is not None:
+		mac = emulator.machine(args.inputFileName)
+		try:
+			mac.run()
+		except Exception as e:
+			print("!!!!!!!!!!BUG!!!!!!!!!!!\n%s" % (str(e)))
+		trace = mac.dump
+	else:
+		parser.error("an input file or --analyze is needed")
+	models = sweep(args.depth, args.branchstage, [f == "on" for f in args.forwarding], args.loadlatency,
+		[None if p == "stall" else p for p in args.predictor])
+	printmodels(evaluate(trace, models))
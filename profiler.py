@@ -0,0 +1,79 @@
+import sys
+import hazard
+
+#where the cycles of a program go. a profile is one more trace consumer: given to hazard.timer as its sink it
+#sees every entry with its timing, given to emulator.machine as its sink it only counts (the stalls stay 0).
+#nothing is added to the run loop, so a run without a profile costs exactly what it did.
+#an entry costs 1 + its stall cycles, and the stalls are charged to the instruction hazard gives them to
+#(the load or the branch). a basic block here is a run of entries started by the first one, the target of a
+#branch or jump, or any PC that does not follow the one before it, and ended by the next such start
+
+class profile:
+    def __init__(self, sink=None):
+        self.sink = sink            #called with every entry after it is counted, to chain a writer's row
+        self.counts = dict()        #PC -> times executed
+        self.stalls = dict()        #PC -> stall cycles charged to it
+        self.ops = dict()           #op -> [times executed, stall cycles]
+        self.blocks = dict()        #entry PC of a block -> [times entered, instructions, stall cycles, last PC]
+        self.block = None           #the list in blocks of the block being run
+        self.next = None            #PC that continues the current block
+        self.count = 0
+
+    def push(self, inst):
+        pc = inst[0][0]
+        op = inst[1]
+        stall = inst[5][1] if inst[5][1] > 0 else 0
+        self.counts[pc] = self.counts.get(pc, 0) + 1
+        if stall:
+            self.stalls[pc] = self.stalls.get(pc, 0) + stall
+        tally = self.ops.get(op)
+        if tally is None:
+            tally = self.ops[op] = [0, 0]
+        tally[0] += 1
+        tally[1] += stall
+        block = self.block
+        if pc != self.next:
+            block = self.blocks.get(pc)
+            if block is None:
+                block = self.blocks[pc] = [0, 0, 0, pc]
+            block[0] += 1
+            self.block = block
+        block[1] += 1
+        block[2] += stall
+        if pc > block[3]:
+            block[3] = pc
+        self.next = None if op in hazard.branchType else pc + 4
+        self.count += 1
+        if self.sink is not None:
+            self.sink(inst)
+
+    def cycles(self, pc):
+        return self.counts[pc] + self.stalls.get(pc, 0)
+
+    def hottest(self, top=10):  #the PCs with the most cycles, the ones with more stalls first on a tie
+        return sorted(self.counts, key=lambda pc: (-self.cycles(pc), -self.stalls.get(pc, 0), pc))[:top]
+
+    def stalling(self, top=10):
+        return sorted(self.stalls, key=lambda pc: (-self.stalls[pc], pc))[:top]
+
+    def hotblocks(self, top=10):
+        return sorted(self.blocks.items(), key=lambda item: (-(item[1][1] + item[1][2]), item[0]))[:top]
+
+    def report(self, instmem=None, top=10, out=sys.stdout):    #instmem of the machine adds the tokens of every PC
+        total = self.count + sum(self.stalls.values())
+        share = lambda cycles: 100.0 * cycles / total if total else 0.0
+        text = lambda pc: " ".join(instmem.get(pc, ())) if instmem is not None else ""
+        out.write("\n\n*******PROFILE******\n")
+        out.write("cycles are 1 per execution plus the stalls charged to the instruction, %d in total\n" % (total))
+        out.write("\nhottest instructions\n%10s%10s%10s%10s%8s  %s\n" % ("PC", "count", "stalls", "cycles", "%", "instruction"))
+        for pc in self.hottest(top):
+            out.write("%10d%10d%10d%10d%8.2f  %s\n" % (pc, self.counts[pc], self.stalls.get(pc, 0), self.cycles(pc), share(self.cycles(pc)), text(pc)))
+        out.write("\nmost stalls\n%10s%10s%10s%8s  %s\n" % ("PC", "count", "stalls", "%", "instruction"))
+        for pc in self.stalling(top):
+            out.write("%10d%10d%10d%8.2f  %s\n" % (pc, self.counts[pc], self.stalls[pc], share(self.stalls[pc]), text(pc)))
+        out.write("\nhottest blocks\n%10s%10s%10s%10s%10s%10s%8s\n" % ("entry", "last", "entered", "insts", "stalls", "cycles", "%"))
+        for entry, (entered, insts, stalls, last) in self.hotblocks(top):
+            out.write("%10d%10d%10d%10d%10d%10d%8.2f\n" % (entry, last, entered, insts, stalls, insts + stalls, share(insts + stalls)))
+        out.write("\nopcodes\n%10s%10s%10s%10s%8s\n" % ("op", "count", "stalls", "cycles", "%"))
+        for op, (count, stalls) in sorted(self.ops.items(), key=lambda item: (-(item[1][0] + item[1][1]), item[0])):
+            out.write("%10s%10d%10d%10d%8.2f\n" % (op, count, stalls, count + stalls, share(count + stalls)))
@@ -0,0 +1,83 @@
+import sys
+import json
+
+#the output formats of main. the timing model (hazard) only writes timing into the trace entries,
+#a writer gets those entries one by one through row and decides what to print. all writing goes to one
+#buffered file, so a long execution table does not cost one system call per line
+
+fields = ("pc", "seq", "op", "rd", "result", "rs1", "val1", "rs2", "val2", "clock", "stall")
+
+def flatten(inst):  #[(PC, counter), op, (d, result), (s1, arg1), (s2, arg2), (clk, stall)] to the values of fields
+    (pc, seq), op, (rd, result), (rs1, val1), (rs2, val2), (clock, stall) = inst
+    return (pc, seq, op, rd, result, rs1, val1, rs2, val2, clock, stall)
+
+def openoutput(path=None, buffering=1 << 20):   #a buffered text file for path, or for stdout if no path is given
+    if path is None:
+        sys.stdout.flush()
+        return open(sys.stdout.fileno(), "w", buffering=buffering, closefd=False)
+    return open(path, "w", buffering=buffering)
+
+
+class tablewriter:  #the human-readable table main has always printed, with the program, data and registers
+    state = True    #whether main should print the program, data memory and registers as well
+
+    def __init__(self, out):
+        self.out = out
+
+    def header(self):
+        self.out.write("\n\n*******EXECUTION******\n")
+        self.out.write("arguments and results are as (register,value) with register being -1 for not a register\n")
+        self.out.write("\n%10s%10s%10s%10s%10s%10s\n" % ("PC&order", "inst.", "result", "arg1", "arg2", "clk&stall"))
+        self.out.write("-" * 60 + "\n")
+
+    def row(self, inst):
+        self.out.write("%10s%10s%10s%10s%10s%10s\n" % (str(inst[0]), inst[1], str(inst[2]), str(inst[3]), str(inst[4]), str(inst[5])))
+
+    def bug(self, e):   #the run threw, the rest is still printed so the user can trace the bug
+        self.out.write("!!!!!!!!!!BUG!!!!!!!!!!!\n%s\nI will dump stuff up to here anyway:\n" % (str(e)))
+
+    def totals(self, timing):
+        self.out.write("\n\n**CLOCKS AND STALLS**\n")
+        self.out.write("Number of instructions executed:  %d\n" % (timing.count))
+        self.out.write("Number of clock cycles:  %d\n" % (timing.clock))
+        self.out.write("Number of stalls added:  %d\n" % (timing.stalls))
+
+
+class summarywriter(tablewriter):   #only the CLOCKS AND STALLS block
+    state = False
+
+    def header(self):
+        pass
+
+    def row(self, inst):
+        pass
+
+
+class csvwriter(tablewriter):   #one line of comma separated fields per instruction, nothing else
+    state = False
+
+    def header(self):
+        self.out.write(",".join(fields) + "\n")
+
+    def row(self, inst):
+        self.out.write("%d,%d,%s,%d,%d,%d,%d,%d,%d,%d,%d\n" % flatten(inst))
+
+    def bug(self, e):   #errors go to stderr to keep the output parseable
+        sys.stderr.write("BUG: %s\n" % (str(e)))
+
+    def totals(self, timing):
+        pass
+
+
+class jsonwriter(csvwriter):    #JSON Lines: an object per instruction and a last one with the totals
+    def header(self):
+        pass
+
+    def row(self, inst):
+        self.out.write(json.dumps(dict(zip(fields, flatten(inst)))) + "\n")
+
+    def totals(self, timing):
+        self.out.write(json.dumps({"instructions": timing.count, "clocks": timing.clock, "stalls": timing.stalls}) + "\n")
+
+
+writers = {"table": tablewriter, "summary": summarywriter, "csv": csvwriter, "jsonl": jsonwriter}
@@ -0,0 +1,279 @@
+import io
+import os
+import copy
+import types
+import glob
+import random
+import multiprocessing
+import pytest
+import emulator
+import hazard
+import mem
+import ops
+import fastops
+import tracebuf
+import dcache
+import pipeline
+import online
+import assembler
+import checkpoint
+import batch
+
+#the checks of the engines and formats that have a reference to compare with: every testcase is run through both
+#and has to give the same timing or the same records. run with python -m pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+testcases = sorted(glob.glob(os.path.join(here, "testcases", "*.a")))
+
+def runtestcase(name, **kwargs):   #the machine after running name to its end or its bug, like main.py keeps the trace up to a bug
+    mac = emulator.machine(name, **kwargs)
+    try:
+        mac.run()
+    except Exception:
+        pass
+    return mac
+
+def totals(timing):
+    return (timing.count, timing.clock, timing.stalls)
+
+
+@pytest.mark.parametrize("name", testcases, ids=os.path.basename)
+def test_vector_timing(name):      #hazardvec against hazard.timer, entry by entry
+    hazardvec = pytest.importorskip("hazardvec")
+    mac = runtestcase(name)
+    expected = []
+    timing = hazard.timer(lambda inst: expected.append(inst[5]))
+    for inst in copy.deepcopy(mac.dump):
+        timing.push(inst)
+    timing.finish()
+    trace = tracebuf.tracebuffer()
+    for inst in mac.dump:
+        trace.append(inst)
+    result = hazardvec.timeTrace(trace)
+    assert list(zip(trace.clock, trace.stall)) == expected
+    assert totals(result) == totals(timing)
+
+@pytest.mark.parametrize("name", testcases, ids=os.path.basename)
+def test_legacy_pipeline(name):    #pipeline.legacy() against hazard, the totals and every entry's timing
+    mac = runtestcase(name)
+    entries = []
+    model = pipeline.evaluate(copy.deepcopy(mac.dump), [pipeline.legacy(sink=lambda inst: entries.append(list(inst)))])[0]
+    assert totals(model) == totals(hazard.hazardDetector(mac.dump))
+    assert entries == mac.dump
+
+def test_pipeline_cachedtiming():   #a model can be followed by a data cache like the other timing models
+    mac = runtestcase(os.path.join(here, "testcases", "slide1.a"))
+    cached = dcache.cachedtiming(dcache.datacache(size=64, ways=1, line=16))
+    model = pipeline.legacy(sink=cached.push)
+    cached.timing = model
+    pipeline.evaluate(copy.deepcopy(mac.dump), [model])
+    timing = hazard.hazardDetector(mac.dump)
+    assert cached.added > 0
+    assert (cached.count, cached.clock, cached.stalls) == (timing.count, timing.clock + cached.added, timing.stalls + cached.added)
+
+@pytest.mark.parametrize("name", testcases, ids=os.path.basename)
+def test_online_pipeline(name):    #online.pipeline against hazard, the totals and every entry's timing
+    entries = []
+    pipe = online.pipeline(lambda inst: entries.append(list(inst)))
+    runtestcase(name, sink=pipe.push)
+    pipe.finish()
+    ref = runtestcase(name)
+    assert totals(pipe) == totals(hazard.hazardDetector(ref.dump))
+    assert entries == ref.dump
+
+@pytest.mark.parametrize("name", testcases, ids=os.path.basename)
+def test_roundtrip(name, tmp_path):     #a program through a binary image and back decodes to the same records
+    text = emulator.machine(name)
+    image = str(tmp_path / "roundtrip.bin")
+    assembler.writeimage([text.instmem[addr] for addr in sorted(text.instmem)], image)
+    binary = emulator.machine(image)
+    assert [rec[:6] if rec else rec for rec in text.decoded] == [rec[:6] if rec else rec for rec in binary.decoded]
+
+@pytest.mark.parametrize("lines", [["lui x1, 1048575", "auipc x2, 524288"], ["lui x1, 0", "addi x1, x1, -1"]])
+def test_roundtrip_upper(lines, tmp_path):   #upper immediates with the top bit set run the same from an image
+    source, image = tmp_path / "upper.a", str(tmp_path / "upper.bin")
+    source.write_text("\n".join(lines) + "\n")
+    text = runtestcase(str(source))
+    assembler.writeimage([text.instmem[addr] for addr in sorted(text.instmem)], image)
+    binary = runtestcase(image)
+    assert binary.dump == text.dump and binary.reg.storage == text.reg.storage
+
+def test_negative_upper():     #lui x1, -1 runs differently from lui x1, 1048575 but would have the same word
+    with pytest.raises(Exception, match="upper immediate -1 does not fit"):
+        assembler.encode(["lui", "x1", "-1"])
+
+def test_cached_image(tmp_path, monkeypatch):    #a cached image is only hashed, not disassembled again
+    name = os.path.join(here, "testcases", "fact.a")
+    image = str(tmp_path / "fact.bin")
+    assembler.writeimage(assembler.parse(name, open(name, "rb").read()), image)
+    first = emulator.machine(image, cache=str(tmp_path))
+    monkeypatch.setattr(assembler, "disassemble", None)
+    again = emulator.machine(image, cache=str(tmp_path))
+    assert again.instmem == first.instmem and [rec[:6] for rec in again.decoded] == [rec[:6] for rec in first.decoded]
+
+
+#programs that fail in the middle of a block: a misaligned lw on the last of three iterations, and a line that
+#does not decode after a loop
+faulting = {"misaligned.a": ["addi x5, x0, 3", "addi x5, x5, -1", "sltui x7, x5, 1", "lw x2, 0(x7)", "bne x5, x0, -12"],
+            "undecodable.a": ["addi x5, x0, 2", "addi x5, x5, -1", "bne x5, x0, -4", "addi x7, x0, 5", "frob x1, x2", "addi x8, x0, 1"]}
+
+def engine(name, method, *args, **kwargs):     #the state after running name with one of the run methods, with the error it raised
+    mac = emulator.machine(name, **kwargs)
+    try:
+        getattr(mac, method)(*args)
+        error = None
+    except Exception as e:
+        error = str(e)
+    return mac.dump, mac.reg.storage, mac.datamem.items(), mac.PC, mac.counter, error
+
+def sources(tmp_path, name):    #the path of a testcase or of a faulting program written to tmp_path
+    if name not in faulting:
+        return name
+    path = tmp_path / name
+    path.write_text("\n".join(faulting[name]) + "\n")
+    return str(path)
+
+@pytest.mark.parametrize("threshold", [1, 2])
+@pytest.mark.parametrize("name", testcases + sorted(faulting), ids=os.path.basename)
+def test_engines(name, threshold, tmp_path, monkeypatch):  #the decoded run and the compiled blocks against the original interpreter
+    #with the ctypes ops: the same trace, registers, memory, PC and counter, also when an instruction fails
+    blocks = pytest.importorskip("blocks")
+    monkeypatch.setattr(blocks, "threshold", threshold)     #1 compiles every block on its first entry
+    name = sources(tmp_path, name)
+    reference = engine(name, "runtext", alu=ops)
+    assert engine(name, "run", 100000) == reference        #limited, so that a bug making a program loop fails instead of hanging
+    assert engine(name, "runblocks", 100000) == reference
+
+@pytest.mark.parametrize("method", ["run", "runblocks"])
+def test_limit(method, tmp_path):  #a program that never ends is stopped, one that ends within the limit is not
+    loop = tmp_path / "loop.a"
+    loop.write_text("addi x1, x0, 1\nbeq x0, x0, 0\n")
+    assert engine(str(loop), method, 1000)[-1] == "Instruction limit of 1000 reached"
+    for name in testcases:
+        count = engine(name, method)[4]
+        assert engine(name, method, count) == engine(name, method)
+        assert engine(name, method, count - 1)[-1] == "Instruction limit of %d reached" % (count - 1)
+
+def test_block_fault(tmp_path):     #a compiled block that fails leaves PC and counter at the failing instruction
+    name = sources(tmp_path, "misaligned.a")
+    dump, regs, items, pc, counter, error = engine(name, "runblocks")
+    assert (pc, counter, error) == (12, 12, "Misaligned memory read address for word!")     #counted, like in run, but not traced
+    assert dump[-1][0] == (8, 11)
+
+
+runprogram = batch.runprogram
+
+def diesoninp(filename, **kwargs):     #a worker that dies while it runs inp.a
+    if filename.endswith("inp.a"):
+        os._exit(3)
+    return runprogram(filename, **kwargs)
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the workers have to see the patched runprogram")
+def test_batch_dead_worker(tmp_path, monkeypatch):     #only the run whose worker died fails, and a program that never ends is stopped
+    loop = tmp_path / "loop.a"
+    loop.write_text("addi x1, x0, 1\nbeq x0, x0, 0\n")
+    monkeypatch.setattr(batch, "runprogram", diesoninp)
+    results = batch.runbatch(testcases + [str(loop)], jobs=2, limit=1000)
+    errors = dict((os.path.basename(r["program"]), r["error"]) for r in results)
+    assert errors.pop("inp.a").startswith("worker failed")
+    assert errors.pop("loop.a") == "Instruction limit of 1000 reached"
+    assert not any(errors.values())
+
+
+def test_checkpoint_deltas(tmp_path):  #every checkpoint file, whole or with deltas appended, loads back to the machine it was saved from
+    name = os.path.join(here, "testcases", "fact.a")
+    path = str(tmp_path / "machine.rvck")
+    mac = emulator.machine(name, memory=mem.pagedmemory)
+    records = 0
+    while mac.step(5):
+        snap = checkpoint.take(mac)
+        if records % 4 == 0:
+            checkpoint.save(snap, path)
+        else:
+            checkpoint.append(snap, path)
+        records += 1
+        other = emulator.machine(name, memory=mem.pagedmemory)
+        checkpoint.restore(other, checkpoint.load(path))
+        assert (other.PC, other.counter, other.reg.storage, other.datamem.items()) == (mac.PC, mac.counter, mac.reg.storage, mac.datamem.items())
+    with open(path, "ab") as f:     #a record cut short by a crash is ignored
+        f.write(b"\x40\0\0\0partial")
+    assert checkpoint.load(path).counter == mac.counter
+
+
+def call(fn, *args):    #the result, or the type of the exception, so failing calls are compared too
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e)
+
+def values(rng, count):     #edge cases around every boundary the masks and sign extensions care about, then random ones
+    edges = [0, 1, 2, 31, 32, 33, 0x7f, 0x80, 0xff, 0x100, 0x7fff, 0x8000, 0xffff, 0x10000,
+        0x7fffffff, 0x80000000, 0xffffffff, 0x100000000, 1 << 40, 1 << 63, 1 << 64]
+    res = edges + [-e for e in edges] + [e - 1 for e in edges] + [e + 1 for e in edges]
+    while len(res) < count:
+        res.append(rng.choice((rng.randrange(-1 << 32, 1 << 32), rng.randrange(-1 << 64, 1 << 64), rng.randrange(-64, 64))))
+    return res
+
+@pytest.mark.parametrize("name", fastops.alus + fastops.branches)
+def test_fastops_alu(name, count=2000):     #every function of fastops against its ops version
+    rng = random.Random(0)
+    vals = values(rng, count)
+    second = list(range(-2, 70)) if name in ("sll", "srl", "sra") else vals
+    fast, ref = getattr(fastops, "op" + name), getattr(ops, "op" + name)
+    for i in range(count * 5):
+        a, b = rng.choice(vals), rng.choice(second)
+        args = (a, b, rng.choice((-8, 4, 12))) if name in fastops.branches else (a, b)
+        assert call(fast, *args) == call(ref, *args), args
+
+@pytest.mark.parametrize("name", fastops.loads + fastops.stores)
+def test_fastops_memory(name, count=2000):
+    rng = random.Random(0)
+    vals = values(rng, count)
+    fast, ref = getattr(fastops, "op" + name), getattr(ops, "op" + name)
+    fmem, rmem = mem.datamemory(), mem.datamemory()
+    for i in range(count):
+        addr, data = rng.randrange(-64, 64), rng.choice(vals)
+        rmem.write(addr, data)
+        fmem.write(addr, data)
+    for i in range(count * 5):
+        addr, data = rng.randrange(-64, 64), rng.choice(vals)
+        args = (addr,) if name in fastops.loads else (addr, data)
+        assert call(fast, fmem, *args) == call(ref, rmem, *args), args
+        assert fmem.items() == rmem.items(), args
+
+def outcome(fn, *args):     #the result, or the type and message of the exception
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e), str(e)
+
+def showdata(memory):
+    out = io.StringIO()
+    emulator.machine.showdata(types.SimpleNamespace(datamem=memory), out)
+    return out.getvalue()
+
+@pytest.mark.parametrize("seed", range(4))
+def test_paged_memory(seed, count=3000):   #pagedmemory against datamemory on random accesses around page boundaries and below 0
+    rng = random.Random(seed)
+    vals = values(rng, 200)
+    ref, paged = mem.datamemory(), mem.pagedmemory()
+    saved = []
+    for i in range(count):
+        addr = rng.choice((rng.randrange(-8200, 8200), rng.choice((-4096, 0, 4096)) + rng.randrange(-6, 6)))
+        kind = rng.randrange(8)
+        if kind < 3:
+            name = ("write", "writehalf", "writeword")[kind]
+            data = rng.choice(vals)
+            assert outcome(getattr(paged, name), addr, data) == outcome(getattr(ref, name), addr, data), (name, addr)
+        elif kind < 6:
+            name = ("get", "gethalf", "getword")[kind - 3]
+            assert outcome(getattr(paged, name), addr) == outcome(getattr(ref, name), addr), (name, addr)
+        elif kind == 6:     #the pages are shared with the snapshot, later writes must not change it
+            saved.append((paged.snapshot(), ref.snapshot(), ref.items()))
+        elif saved:
+            pstate, rstate, items = rng.choice(saved)
+            paged.restore(pstate)
+            ref.restore(rstate)
+            assert paged.items() == items
+    assert paged.items() == ref.items()
+    assert showdata(paged) == showdata(ref)
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import mmap
+from array import array
+
+#the dump entries of the emulator are lists of tuples like [(PC, counter), op, (d, result), (s1, arg1), (s2, arg2), (clk, stall)]
+#a tracebuffer keeps the same information in typed columns instead, about 60 bytes per instruction.
+#opcodes are interned: the column holds an index into the opcodes list
+columns = (("pc", "q"), ("seq", "q"), ("op", "B"), ("rd", "b"), ("result", "q"), ("rs1", "b"), ("val1", "q"),
+           ("rs2", "b"), ("val2", "q"), ("clock", "q"), ("stall", "b"))
+
+
+class traceentry(list):  #a dump entry read from a tracebuffer. writing its timing (index 5, as hazard does) writes it back into the buffer
+    __slots__ = ("trace", "index")
+
+    def __setitem__(self, key, value):
+        list.__setitem__(self, key, value)
+        if (key == 5):
+            self.trace.settiming(self.index, value[0], value[1])
+
+
+class tracebuffer:
+    def __init__(self, spill=None, chunk=65536):
+        self.opcodes = list()           #interned opcode names, indexed by the op column
+        self.opids = dict()             #and the reverse mapping used while appending
+        for name, code in columns:
+            setattr(self, name, array(code))
+        self.spill = spill              #directory to move full chunks to during long runs, see flush
+        self.chunk = chunk
+        self.spilled = 0                #number of entries already on disk
+        self.readonly = False
+        if spill is not None:
+            os.makedirs(spill, exist_ok=True)
+            for name, code in columns:
+                open(os.path.join(spill, name + ".bin"), "wb").close()
+
+    def append(self, entry):    #takes a dump entry. can be given to emulator.machine as its sink
+        if self.readonly:
+            raise Exception("Can not append to a trace loaded from disk!")
+        (pc, seq), op, (rd, result), (rs1, val1), (rs2, val2), (clock, stall) = entry
+        opid = self.opids.get(op)
+        if opid is None:
+            opid = self.opids[op] = len(self.opcodes)
+            self.opcodes.append(op)
+        self.pc.append(pc)
+        self.seq.append(seq)
+        self.op.append(opid)
+        self.rd.append(rd)
+        self.result.append(result)
+        self.rs1.append(rs1)
+        self.val1.append(val1)
+        self.rs2.append(rs2)
+        self.val2.append(val2)
+        self.clock.append(clock)
+        self.stall.append(stall)
+        if self.spill is not None and len(self.pc) >= self.chunk:
+            self.flush()
+
+    def flush(self):    #appends the entries in memory to the column files of the spill directory and forgets them
+        count = len(self)
+        for name, code in columns:
+            col = getattr(self, name)
+            with open(os.path.join(self.spill, name + ".bin"), "ab") as out:
+                col.tofile(out)
+            del col[:]
+        self.spilled = count
+
+    def close(self):    #finishes a spilled trace, after which it can be opened with load
+        if self.spill is None:
+            return
+        self.flush()
+        self.writemeta(self.spill, self.spilled)
+
+    def save(self, path):   #writes the whole trace in the same format as a spilled one
+        if self.spilled:
+            raise Exception("Trace was already spilled, close it instead!")
+        os.makedirs(path, exist_ok=True)
+        for name, code in columns:
+            with open(os.path.join(path, name + ".bin"), "wb") as out:
+                out.write(getattr(self, name).tobytes())
+        self.writemeta(path, len(self))
+
+    def writemeta(self, path, count):
+        meta = {"count": count, "opcodes": self.opcodes, "byteorder": sys.byteorder, "columns": dict(columns)}
+        with open(os.path.join(path, "meta.json"), "w") as out:
+            json.dump(meta, out)
+
+    @staticmethod
+    def load(path, update=False):   #memory-maps a saved trace. timing written to it goes to the files only if update is set
+        with open(os.path.join(path, "meta.json")) as inp:
+            meta = json.load(inp)
+        if meta["byteorder"] != sys.byteorder:
+            raise Exception("Trace was written on a machine with different byte order!")
+        buf = tracebuffer()
+        buf.opcodes = meta["opcodes"]
+        buf.opids = {op: i for i, op in enumerate(buf.opcodes)}
+        buf.readonly = True
+        if meta["count"] == 0:  #empty files can not be mapped, the empty arrays will do
+            return buf
+        for name, code in columns:
+            with open(os.path.join(path, name + ".bin"), "r+b" if update else "rb") as inp:
+                mm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_WRITE if update else mmap.ACCESS_COPY)
+            setattr(buf, name, memoryview(mm).cast(code))
+        return buf
+
+    def settiming(self, index, clock, stall):
+        self.clock[index] = clock
+        self.stall[index] = stall
+
+    def __len__(self):
+        return self.spilled + len(self.pc)
+
+    def __getitem__(self, index):   #rebuilds the dump entry at index
+        if index < 0:
+            index += len(self)
+        i = index - self.spilled
+        if i < 0:
+            raise Exception("Trace entry was spilled to disk, load the trace to read it!")
+        if i >= len(self.pc):
+            raise IndexError("trace index out of range")
+        entry = traceentry([(self.pc[i], self.seq[i]), self.opcodes[self.op[i]], (self.rd[i], self.result[i]),
+                            (self.rs1[i], self.val1[i]), (self.rs2[i], self.val2[i]), (self.clock[i], self.stall[i])])
+        entry.trace = self
+        entry.index = i
+        return entry
+
+    def __iter__(self):
+        for i in range(self.spilled, len(self)):
+            yield self[i]
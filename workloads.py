@@ -0,0 +1,156 @@
+import os
+import argparse
+
+#generators of synthetic RV32I programs, as assembly for the assembler module (labels, no pseudoinstructions),
+#to measure the emulator on more than the few instructions of testcases. every generator takes a size and
+#returns the lines of a program that runs about as many instructions as its comment says and then falls off the end.
+#constants that do not fit an addi are built with lui and addi, so every program also assembles to a binary image
+
+def li(reg, value):     #the lines to load a constant into reg
+    if -2048 <= value < 2048:
+        return ["    addi %s, x0, %d" % (reg, value)]
+    hi = (value + 0x800) >> 12
+    lo = value - (hi << 12)
+    lines = ["    lui %s, %d" % (reg, hi & 0xfffff)]
+    if lo:
+        lines.append("    addi %s, %s, %d" % (reg, reg, lo))
+    return lines
+
+def arith(n):       #a loop of ALU operations on values that keep changing, 12 instructions per iteration
+    return li("x5", n) + li("x6", 1) + li("x7", 3) + [
+        "loop:",
+        "    add x8, x6, x7",
+        "    xor x9, x8, x6",
+        "    slli x10, x9, 3",
+        "    srli x11, x10, 2",
+        "    or x6, x11, x8",
+        "    and x7, x6, x9",
+        "    sub x12, x8, x7",
+        "    slt x13, x12, x6",
+        "    sltu x14, x12, x6",
+        "    addi x7, x7, 7",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, loop"]
+
+def stream(n):      #writes n words to an array and sums them again, 10 instructions and one access per word
+    return li("x20", 0x10000) + li("x5", n) + [
+        "    add x6, x20, x0",
+        "    addi x7, x0, 0",
+        "fill:",
+        "    sw x7, 0(x6)",
+        "    addi x7, x7, 3",
+        "    addi x6, x6, 4",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, fill"] + li("x5", n) + [
+        "    add x6, x20, x0",
+        "    addi x8, x0, 0",
+        "sum:",
+        "    lw x9, 0(x6)",
+        "    add x8, x8, x9",
+        "    addi x6, x6, 4",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, sum"]
+
+def chase(n, nodes=4096, step=1543):    #links nodes of 16 bytes in a scattered cycle, then follows n pointers, 3 instructions each
+    return li("x20", 0x20000) + li("x21", nodes) + li("x22", step) + li("x5", nodes) + [
+        "    addi x10, x0, 0",
+        "build:",
+        "    add x12, x10, x22",        #next index, step further modulo nodes. step and nodes are coprime,
+        "    blt x12, x21, inside",     #so the cycle goes through every node
+        "    sub x12, x12, x21",
+        "inside:",
+        "    slli x13, x10, 4",
+        "    add x13, x13, x20",
+        "    slli x14, x12, 4",
+        "    add x14, x14, x20",
+        "    sw x14, 0(x13)",
+        "    add x10, x12, x0",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, build"] + li("x5", n) + [
+        "    add x11, x20, x0",
+        "follow:",
+        "    lw x11, 0(x11)",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, follow"]
+
+def branchy(n):     #a xorshift generator and branches on its bits, about 13 instructions per iteration
+    return li("x6", 2463534242) + li("x5", n) + [
+        "loop:",
+        "    slli x7, x6, 13",
+        "    xor x6, x6, x7",
+        "    srli x7, x6, 17",
+        "    xor x6, x6, x7",
+        "    slli x7, x6, 5",
+        "    xor x6, x6, x7",
+        "    andi x8, x6, 1",
+        "    beq x8, x0, even",
+        "    addi x9, x9, 1",
+        "    andi x8, x6, 2",
+        "    bne x8, x0, next",
+        "    addi x10, x10, 1",
+        "    jal x0, next",
+        "even:",
+        "    addi x11, x11, 1",
+        "next:",
+        "    addi x5, x5, -1",
+        "    bne x5, x0, loop"]
+
+def recursion(n, depth=1000):   #sums depth down to 0 recursively like fact.a, about 12 instructions per level, repeated for n levels in total
+    return returns(li("sp", 0x100000 + 8 * depth) + li("x18", max(1, n // depth)) + [
+        "outer:"] + li("x10", depth) + [
+        "    jal x1, sum",
+        "    addi x18, x18, -1",
+        "    bne x18, x0, outer",
+        "    jal x0, end",
+        "sum:",
+        "    addi sp, sp, -8",
+        "    sw x1, 4(sp)",
+        "    sw x10, 0(sp)",
+        "    bne x10, x0, deeper",
+        "    addi sp, sp, 8",
+        "    jalr x0, RET(x1)",
+        "deeper:",
+        "    addi x10, x10, -1",
+        "    jal x1, sum",
+        "    lw x11, 0(sp)",
+        "    lw x1, 4(sp)",
+        "    add x10, x10, x11",
+        "    addi sp, sp, 8",
+        "    jalr x0, RET(x1)",
+        "end:"])
+
+def returns(lines):     #the emulator's jalr adds rs1 + offset to its own PC, so a return to the address jal left in x1
+    #has the negated address of the jalr as its offset. RET in a jalr is replaced by that
+    res = []
+    addr = 0
+    for line in lines:
+        if "RET" in line:
+            line = line.replace("RET", str(-addr))
+        res.append(line)
+        if not line.rstrip().endswith(":"):
+            addr += 4
+    return res
+
+#name -> (generator, size at scale 1). the sizes give a few hundred thousand instructions each
+generators = {"arith": (arith, 25000), "stream": (stream, 25000), "chase": (chase, 60000),
+              "branchy": (branchy, 20000), "recursion": (recursion, 20000)}
+
+def generate(name, scale=1.0):
+    fn, size = generators[name]
+    return fn(max(1, int(size * scale)))
+
+def writeworkload(name, path, scale=1.0):
+    with open(path, "w") as out:
+        out.write("# %s workload, scale %g (see workloads module)\n" % (name, scale))
+        out.write("\n".join(generate(name, scale)) + "\n")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="write the synthetic workloads as .s programs")
+    parser.add_argument("dir", help="directory to write them to")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of every workload")
+    parser.add_argument("--only", nargs="+", choices=sorted(generators), help="only these workloads")
+    args = parser.parse_args()
+    os.makedirs(args.dir, exist_ok=True)
+    for name in args.only or sorted(generators):
+        print(writeworkload(name, os.path.join(args.dir, name + ".s"), args.scale))